@@ -0,0 +1,237 @@
+# app/admission.py
+"""
+Admission control in front of the routes: token buckets per client and per (client, route),
+and a global in-flight cap sized to the DB pool. Excess requests are shed right away with
+429 / 503 and Retry-After rather than queued behind the pool, so one client's retry loop
+can't push up everyone's latency.
+
+Clients are identified by the X-User-Id header, else the user id in the path, else (on
+writes) the acting user named in the JSON body -- `user_id` / `created_by_id` /
+`requested_by_id`, or the `email` being signed up -- so each user of the app gets their own
+write buckets. Requests with none of these fall back to the peer address, with limits
+ADMISSION_IP_MULTIPLIER times higher since many users can share one address (NAT, proxies);
+X-Forwarded-For is only honoured from ADMISSION_TRUSTED_PROXIES. Bucket state lives behind
+`BucketStore`; the in-flight cap is per process, like the pool it protects.
+"""
+import ipaddress
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Protocol
+
+from starlette.routing import Match
+
+from contacts import normalize_email
+from db import POOL_MAX_OVERFLOW, POOL_SIZE
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(POOL_SIZE + POOL_MAX_OVERFLOW)))
+CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "20"))  # requests per second, all routes
+CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", "40"))
+READ_RATE = float(os.getenv("ADMISSION_READ_RATE", "10"))  # per client and GET route
+READ_BURST = float(os.getenv("ADMISSION_READ_BURST", "20"))
+WRITE_RATE = float(os.getenv("ADMISSION_WRITE_RATE", "2"))  # per client and write route
+WRITE_BURST = float(os.getenv("ADMISSION_WRITE_BURST", "10"))
+BUSY_RETRY_AFTER = int(os.getenv("ADMISSION_BUSY_RETRY_AFTER", "1"))  # seconds, on 503
+IP_MULTIPLIER = float(os.getenv("ADMISSION_IP_MULTIPLIER", "20"))  # for clients known only by address
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(net.strip(), strict=False)
+    for net in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if net.strip()
+]
+
+# Never limited: scraping and ops endpoints must keep working when the API is saturated.
+EXEMPT_PREFIXES = ("/metrics", "/internal", "/docs", "/redoc", "/openapi.json")
+# Rate limited, but not counted in flight: long-lived streams that hold no DB connection.
+UNCOUNTED_ROUTES = {"/users/{user_id}/events"}
+
+_PATH_USER = re.compile(r"^/(?:users|loans/dashboard)/(\d+)")
+_BODY_USER_FIELDS = ("user_id", "created_by_id", "requested_by_id")
+
+class BucketStore(Protocol):
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Takes one token from `key`'s bucket; returns 0 if it had one, else seconds until it will."""
+        ...
+
+class LocalBucketStore:
+    """Token buckets in an LRU dict; idle buckets are full anyway, so evicting them is free."""
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # key -> (tokens, updated)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+store: BucketStore = LocalBucketStore()
+
+def set_store(new_store: BucketStore) -> None:
+    global store
+    store = new_store
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    in_flight: int = 0
+    shed: dict[tuple[str, str], int] = field(default_factory=dict)  # (route, reason) -> count
+
+    def record_shed(self, route: str, reason: str) -> None:
+        self.shed[(route, reason)] = self.shed.get((route, reason), 0) + 1
+
+stats = AdmissionStats()
+
+def _header(scope, name: bytes):
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+def _trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in net for net in TRUSTED_PROXIES)
+
+def client_ip(scope) -> str:
+    """The peer address, or the first hop before our trusted proxies in X-Forwarded-For."""
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    forwarded = _header(scope, b"x-forwarded-for") if _trusted(peer) else None
+    if forwarded:
+        for hop in reversed([h.strip() for h in forwarded.split(",")]):
+            if not _trusted(hop):
+                return hop
+    return peer
+
+def body_identity(body: bytes):
+    """`user:<id>` or `email:<address>` from a JSON write body (first item of a batch), or None."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if isinstance(data, list):
+        data = data[0] if data else None
+    if not isinstance(data, dict):
+        return None
+    for name in _BODY_USER_FIELDS:
+        value = data.get(name)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return f"user:{value}"
+    email = data.get("email")
+    if isinstance(email, str) and email.strip():
+        return f"email:{normalize_email(email)}"
+    return None
+
+def client_key(scope, body: bytes = b"") -> str:
+    user = _header(scope, b"x-user-id")
+    if user:
+        return f"user:{user}"
+    m = _PATH_USER.match(scope["path"])
+    if m:
+        return f"user:{m.group(1)}"
+    return (body and body_identity(body)) or f"ip:{client_ip(scope)}"
+
+async def _read_body(receive) -> tuple[bytes, list[dict]]:
+    """Drains the request body; returns it and the messages to replay to the app."""
+    messages, chunks = [], []
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks), messages
+
+def _replay(messages: list[dict], receive):
+    async def replay():
+        return messages.pop(0) if messages else await receive()
+    return replay
+
+class AdmissionMiddleware:
+    """Pure ASGI; `routers` (APIRouters) are matched up front to key buckets by route template."""
+
+    def __init__(self, app, routers=(), max_in_flight: int = MAX_IN_FLIGHT, enabled: bool = ENABLED):
+        self.app = app
+        self.routes = [route for router in routers for route in router.routes]
+        self.max_in_flight = max_in_flight
+        self.enabled = enabled
+
+    def _route(self, scope):
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        route = self._route(scope)
+        template = getattr(route, "path", "<unmatched>")
+        write = scope["method"] not in ("GET", "HEAD", "OPTIONS")
+        body = b""
+        if write and not _header(scope, b"x-user-id") and not _PATH_USER.match(scope["path"]):
+            body, buffered = await _read_body(receive)
+            receive = _replay(buffered, receive)
+        client = client_key(scope, body)
+        scale = IP_MULTIPLIER if client.startswith("ip:") else 1.0
+        rate, burst = (WRITE_RATE, WRITE_BURST) if write else (READ_RATE, READ_BURST)
+        wait = max(
+            await store.take(client, CLIENT_RATE * scale, CLIENT_BURST * scale),
+            await store.take(f"{client}|{scope['method']} {template}", rate * scale, burst * scale),
+        )
+        if wait > 0:
+            await self._shed(scope, send, route, 429, "rate_limited", wait)
+            return
+        counted = template not in UNCOUNTED_ROUTES
+        if counted and stats.in_flight >= self.max_in_flight:
+            await self._shed(scope, send, route, 503, "overloaded", BUSY_RETRY_AFTER)
+            return
+        stats.admitted += 1
+        if counted:
+            stats.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if counted:
+                stats.in_flight -= 1
+
+    async def _shed(self, scope, send, route, status: int, reason: str, retry_after: float) -> None:
+        template = getattr(route, "path", "<unmatched>")
+        stats.record_shed(template, reason)
+        if route is not None:
+            scope["route"] = route  # so ProfilingMiddleware files the response under its route
+        detail = "Too many requests" if status == 429 else "Server busy"
+        body = json.dumps({"detail": detail}).encode()
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+def snapshot() -> dict:
+    return {
+        "admitted": stats.admitted,
+        "in_flight": stats.in_flight,
+        "max_in_flight": MAX_IN_FLIGHT,
+        "shed": [{"route": r, "reason": why, "count": n} for (r, why), n in sorted(stats.shed.items())],
+    }
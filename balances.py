@@ -0,0 +1,192 @@
+# app/balances.py
+"""
+Incremental maintenance of `user_balances`.
+
+Every code path that changes a loan's status or outstanding amount calls `apply()` with the
+loan's state before and after, inside its own transaction. Offline check / repair:
+
+    python balances.py verify    # exit 1 on any mismatch against `loans`
+    python balances.py rebuild   # recompute the whole table
+"""
+import argparse
+import asyncio
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import Integer, Numeric, RowMapping, case, delete, func, literal, select, text, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import SessionLocal, engine
+from models import Currency, Loan, LoanStatus, UserBalance
+
+OUTSTANDING = (LoanStatus.ACTIVE, LoanStatus.OVERDUE)
+AMOUNTS = ("lent_outstanding", "borrowed_outstanding", "overdue_amount")
+COUNTS = ("lent_count", "borrowed_count", "overdue_count")
+
+@dataclass(frozen=True)
+class LoanState:
+    """What a loan contributes to balances; snapshot it before the UPDATE that changes it."""
+    lender_id: int
+    borrower_id: int
+    currency: Currency
+    status: LoanStatus
+    outstanding: Decimal
+
+    @classmethod
+    def of(cls, loan, **changes) -> "LoanState":
+        state = cls(
+            lender_id=loan.lender_id, borrower_id=loan.borrower_id, currency=loan.currency, status=loan.status,
+            outstanding=Decimal(loan.amount) - Decimal(loan.repaid_amount or 0),
+        )
+        return cls(**{**state.__dict__, **changes}) if changes else state
+
+def _contribution(state: Optional[LoanState], sign: int, into: dict) -> None:
+    if state is None or state.status not in OUTSTANDING:
+        return
+    amount = state.outstanding * sign
+    lender = into[(state.lender_id, state.currency)]
+    borrower = into[(state.borrower_id, state.currency)]
+    lender["lent_outstanding"] += amount
+    lender["lent_count"] += sign
+    borrower["borrowed_outstanding"] += amount
+    borrower["borrowed_count"] += sign
+    if state.status == LoanStatus.OVERDUE:
+        for side in (lender, borrower):
+            side["overdue_amount"] += amount
+            side["overdue_count"] += sign
+
+def _upsert(session: AsyncSession):
+    return postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+
+async def apply(session: AsyncSession, changes: Iterable[tuple[Optional[LoanState], Optional[LoanState]]]) -> None:
+    """
+    Adds (after - before) for each changed loan with a single multi-row
+    INSERT ... ON CONFLICT DO UPDATE SET col = col + excluded.col. Does not commit.
+    """
+    deltas: dict = defaultdict(lambda: dict.fromkeys(AMOUNTS, Decimal("0")) | dict.fromkeys(COUNTS, 0))
+    for before, after in changes:
+        _contribution(before, -1, deltas)
+        _contribution(after, +1, deltas)
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "currency": currency, **delta, "updated_at": now}
+        # sorted, so concurrent transactions lock rows in the same order
+        for (user_id, currency), delta in sorted(deltas.items(), key=lambda kv: (kv[0][0], kv[0][1].value))
+        if any(delta.values())
+    ]
+    if not rows:
+        return
+    stmt = _upsert(session)(UserBalance).values(rows)
+    table = UserBalance.__table__
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.currency],
+        set_={**{col: table.c[col] + stmt.excluded[col] for col in AMOUNTS + COUNTS}, "updated_at": now},
+    ))
+
+async def for_user(session: AsyncSession, user_id: int) -> Sequence[RowMapping]:
+    """
+    A user's non-empty balances, one mapping per currency (columns only, no ORM entities).
+    ACTIVE loans already past due count as overdue here, as they do in the loan views
+    (routers/loans.py `_effective_status`), instead of waiting for the next overdue sweep.
+    """
+    today = datetime.utcnow().date()
+    outstanding = (Loan.amount - Loan.repaid_amount).label("amount")
+    late = union_all(*(
+        select(Loan.currency, outstanding)
+        .where(party == user_id, Loan.status == LoanStatus.ACTIVE, Loan.due_date < today)
+        for party in (Loan.lender_id, Loan.borrower_id)
+    )).subquery()
+    unswept = (
+        select(late.c.currency, func.sum(late.c.amount).label("amount"), func.count().label("n"))
+        .group_by(late.c.currency)
+        .subquery()
+    )
+    result = await session.execute(
+        select(
+            UserBalance.currency, UserBalance.lent_outstanding, UserBalance.borrowed_outstanding,
+            (UserBalance.overdue_amount + func.coalesce(unswept.c.amount, 0)).label("overdue_amount"),
+            UserBalance.lent_count, UserBalance.borrowed_count,
+            (UserBalance.overdue_count + func.coalesce(unswept.c.n, 0)).label("overdue_count"),
+        )
+        .outerjoin(unswept, unswept.c.currency == UserBalance.currency)
+        .where(UserBalance.user_id == user_id, UserBalance.lent_count + UserBalance.borrowed_count > 0)
+        .order_by(UserBalance.currency)
+    )
+    return result.mappings().all()
+
+# --- offline verify / rebuild ---
+def _expected():
+    """user_balances as recomputed from `loans`: (user_id, currency, *AMOUNTS, *COUNTS)."""
+    outstanding = Loan.amount - Loan.repaid_amount
+    overdue = Loan.status == LoanStatus.OVERDUE
+    zero, none = literal(0, Numeric(14, 2)), literal(0, Integer)
+    over_amount = case((overdue, outstanding), else_=zero)
+    over_count = case((overdue, 1), else_=0)
+    sides = union_all(
+        select(Loan.lender_id.label("user_id"), Loan.currency, outstanding.label("lent"), zero.label("borrowed"),
+               over_amount.label("over"), literal(1, Integer).label("lc"), none.label("bc"), over_count.label("oc"))
+        .where(Loan.status.in_(OUTSTANDING)),
+        select(Loan.borrower_id, Loan.currency, zero, outstanding,
+               over_amount, none, literal(1, Integer), over_count)
+        .where(Loan.status.in_(OUTSTANDING)),
+    ).subquery()
+    return select(
+        sides.c.user_id, sides.c.currency,
+        func.sum(sides.c.lent), func.sum(sides.c.borrowed), func.sum(sides.c.over),
+        func.sum(sides.c.lc), func.sum(sides.c.bc), func.sum(sides.c.oc),
+    ).group_by(sides.c.user_id, sides.c.currency)
+
+async def verify(session: AsyncSession) -> list[str]:
+    expected = {(r[0], r[1]): tuple(r[2:]) for r in (await session.execute(_expected())).all()}
+    actual = {
+        (b.user_id, b.currency): tuple(getattr(b, col) for col in AMOUNTS + COUNTS)
+        for b in (await session.execute(select(UserBalance))).scalars()
+    }
+    empty = (Decimal("0"),) * len(AMOUNTS) + (0,) * len(COUNTS)
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys(), key=lambda k: (k[0], k[1].value)):
+        want, got = expected.get(key, empty), actual.get(key, empty)
+        if tuple(map(Decimal, want)) != tuple(map(Decimal, got)):
+            mismatches.append(f"user {key[0]} {key[1].value}: expected {want}, found {got}")
+    return mismatches
+
+async def rebuild(session: AsyncSession) -> int:
+    if session.bind.dialect.name == "postgresql":
+        # incremental writers queue behind the rebuild instead of interleaving with it
+        await session.execute(text("LOCK TABLE user_balances IN EXCLUSIVE MODE"))
+    await session.execute(delete(UserBalance))
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": r[0], "currency": r[1], **dict(zip(AMOUNTS + COUNTS, r[2:])), "updated_at": now}
+        for r in (await session.execute(_expected())).all()
+    ]
+    if rows:
+        await session.execute(_upsert(session)(UserBalance).values(rows))
+    await session.commit()
+    return len(rows)
+
+async def _main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check or rebuild user_balances against loans.")
+    parser.add_argument("command", choices=("verify", "rebuild"))
+    args = parser.parse_args(argv)
+
+    try:
+        async with SessionLocal() as session:
+            if args.command == "rebuild":
+                print(f"user_balances rebuilt: {await rebuild(session)} row(s)")
+                return 0
+            mismatches = await verify(session)
+            for line in mismatches:
+                print(line)
+            print(f"{len(mismatches)} mismatch(es)")
+            return 1 if mismatches else 0
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
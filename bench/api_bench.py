@@ -0,0 +1,319 @@
+# app/bench/api_bench.py
+"""
+Seeds a synthetic dataset and drives every route of routers/loans.py and routers/users.py
+with concurrent async clients, reporting throughput and p50/p95/p99 latency per scenario.
+
+    python bench/api_bench.py --database-url sqlite+aiosqlite:///bench.db --reset-database --out run.json
+    python bench/api_bench.py --no-seed --baseline run.json --max-regression 0.2   # exit 1 on regression
+
+Seeding drops every table in --database-url first, so it only runs with --reset-database;
+--no-seed reuses the data already there.
+
+By default requests go through the ASGI app in-process (no server, no network);
+--base-url targets a running server instead, which must use the same database.
+SQLite is a rough stand-in only: write scenarios contend on its single lock.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite+aiosqlite:///bench.db"))
+    p.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    p.add_argument("--users", type=int, default=500)
+    p.add_argument("--friends-per-user", type=int, default=20)
+    p.add_argument("--loans", type=int, default=20_000)
+    p.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    p.add_argument("--concurrency", type=int, default=20)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--reset-database", action="store_true",
+                   help="drop all tables in --database-url and seed a fresh dataset")
+    p.add_argument("--no-seed", action="store_true", help="reuse the data already in the database")
+    p.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    p.add_argument("--admission", action="store_true",
+                   help="keep admission control on (off by default: the whole bench is one client)")
+    p.add_argument("--only", nargs="*", help="run only these scenarios")
+    p.add_argument("--out", help="write results as JSON")
+    p.add_argument("--baseline", help="compare against a previous --out file")
+    p.add_argument("--max-regression", type=float, default=0.2,
+                   help="allowed relative p95 increase / throughput drop vs the baseline")
+    args = p.parse_args(argv)
+    if not args.no_seed and not args.reset_database:
+        p.error("seeding drops every table in --database-url: pass --reset-database, or --no-seed to reuse its data")
+    return args
+
+# --- dataset ---
+async def seed(args) -> None:
+    from sqlalchemy import insert
+    import balances
+    from db import Base, SessionLocal, engine
+    from contacts import contact_hash, normalize_email, normalize_phone
+    from models import Currency, Loan, LoanStatus, User, UserFriend
+
+    rng = random.Random(args.seed)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+        await conn.execute(insert(User), [
+            {"id": i, "email": f"user{i}@bench.example.com", "phone": f"+2126{i:08d}", "pseudonym": f"user{i}",
+             "email_sha256": contact_hash(f"user{i}@bench.example.com", normalize_email),
+             "phone_sha256": contact_hash(f"+2126{i:08d}", normalize_phone)}
+            for i in range(1, args.users + 1)
+        ])
+
+        pairs = set()
+        for user in range(1, args.users + 1):
+            for _ in range(args.friends_per_user // 2):
+                other = rng.randint(1, args.users)
+                if other != user:
+                    pairs.add((min(user, other), max(user, other)))
+        if pairs:
+            await conn.execute(insert(UserFriend), [{"user_id": a, "friend_id": b} for a, b in sorted(pairs)])
+
+        today = date.today()
+        statuses, currencies = list(LoanStatus), list(Currency)
+        rows = []
+        for _ in range(args.loans):
+            lender, borrower = rng.sample(range(1, args.users + 1), 2)
+            status = rng.choice(statuses)
+            confirmed = status not in (LoanStatus.PENDING, LoanStatus.CANCELLED)
+            rows.append({
+                "lender_id": lender, "borrower_id": borrower,
+                "amount": round(rng.uniform(10, 5000), 2), "currency": rng.choice(currencies),
+                "due_date": today + timedelta(days=rng.randint(-120, 120)), "status": status,
+                "lender_confirmed": confirmed, "borrower_confirmed": True,
+                "confirmed_at": datetime.utcnow() if confirmed else None, "created_by_id": borrower,
+            })
+        for start in range(0, len(rows), 5000):
+            await conn.execute(insert(Loan), rows[start:start + 5000])
+
+        if engine.dialect.name == "postgresql":
+            # explicit ids above do not advance the sequences
+            for table in ("users", "user_friends", "loans"):
+                await conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                )
+            await conn.exec_driver_sql("ANALYZE")
+
+    # loans were inserted behind the incremental maintenance's back
+    async with SessionLocal() as session:
+        await balances.rebuild(session)
+
+# --- scenarios ---
+def scenarios(args):
+    """name -> coroutine function (client, rng) issuing one request."""
+    users = args.users
+    today = date.today()
+
+    def uid(rng):
+        return rng.randint(1, users)
+
+    def two(rng):
+        return rng.sample(range(1, users + 1), 2)
+
+    def loan_id(rng):
+        return rng.randint(1, args.loans)
+
+    def new_loan(rng):
+        lender, borrower = two(rng)
+        return {"lender_id": lender, "borrower_id": borrower, "amount": f"{rng.uniform(1, 500):.2f}",
+                "currency": "MAD", "due_date": str(today + timedelta(days=30)), "created_by_id": borrower}
+
+    async def confirm(client, rng):
+        r = await client.post("/loans", json=new_loan(rng))
+        loan = r.json()
+        return await client.post(f"/loans/{loan['id']}/confirm", json={"user_id": loan["lender_id"]})
+
+    async def confirm_batch(client, rng):
+        created = (await client.post("/loans/batch", json=[new_loan(rng) for _ in range(20)])).json()["created"]
+        return await client.post("/loans/confirm/batch",
+                                 json=[{"loan_id": l["id"], "user_id": l["lender_id"]} for l in created])
+
+    async def propose_and_act(client, rng):
+        loan = (await confirm(client, rng)).json()
+        proposal = (await client.post(f"/loans/{loan['id']}/confirmations", json={
+            "type": "REPAYMENT", "payload": {"amount": loan["amount"]}, "requested_by_id": loan["borrower_id"],
+        })).json()
+        return await client.post(f"/loans/{loan['id']}/confirmations/{proposal['id']}/act",
+                                 json={"accept": True, "user_id": loan["lender_id"]})
+
+    async def add_friend(client, rng):
+        a, b = two(rng)
+        return await client.post(f"/users/{a}/friends", json={"friend_id": b})
+
+    async def add_friend_by_email(client, rng):
+        a, b = two(rng)
+        return await client.post(f"/users/{a}/friends/email", json={"email": f"user{b}@bench.example.com"})
+
+    async def delete_friend(client, rng):
+        a, b = two(rng)
+        await client.post(f"/users/{a}/friends", json={"friend_id": b})
+        return await client.delete(f"/users/{a}/friends/{b}")
+
+    async def match_contacts(client, rng):
+        # An onboarding address book: 500 contacts, a fifth of them on the app.
+        book = [f"user{uid(rng)}@bench.example.com" if rng.random() < 0.2 else f"nobody{rng.random()}@example.com"
+                for _ in range(500)]
+        hashes = [hashlib.sha256(email.encode()).hexdigest() for email in book]
+        return await client.post(f"/users/{uid(rng)}/contacts/match", json={"email_hashes": hashes})
+
+    return {
+        # routers/loans.py
+        "get_loan": lambda c, rng: c.get(f"/loans/{loan_id(rng)}"),
+        "dashboard": lambda c, rng: c.get(f"/loans/dashboard/{uid(rng)}"),
+        "create_loan": lambda c, rng: c.post("/loans", json=new_loan(rng)),
+        "create_loans_batch": lambda c, rng: c.post("/loans/batch", json=[new_loan(rng) for _ in range(20)]),
+        "confirm_loan": confirm,
+        "confirm_loans_batch": confirm_batch,
+        "propose_and_act": propose_and_act,
+        # routers/users.py
+        "get_user_profile": lambda c, rng: c.get(f"/users/{uid(rng)}"),
+        "create_or_login_user": lambda c, rng: c.post("/users", json={"email": f"user{uid(rng)}@bench.example.com"}),
+        "get_friends": lambda c, rng: c.get(f"/users/{uid(rng)}/friends"),
+        "get_mutual_friends": lambda c, rng: c.get("/users/{}/friends/mutual/{}".format(*two(rng))),
+        "get_friend_suggestions": lambda c, rng: c.get(f"/users/{uid(rng)}/friends/suggestions"),
+        "add_friend": add_friend,
+        "add_friend_by_email": add_friend_by_email,
+        "delete_friend": delete_friend,
+        "match_contacts": match_contacts,
+    }
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+async def run_scenario(client, fn, args, seed: int) -> dict:
+    latencies, statuses, errors = [], {}, 0
+    remaining = iter(range(args.requests))
+
+    async def worker(n: int):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + n)
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await fn(client, rng)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 500:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, base in baseline["scenarios"].items():
+        current = results["scenarios"].get(name)
+        if current is None:
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {current['p95_ms']} ms")
+        if base["throughput_rps"] and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {current['throughput_rps']} rps")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {current['errors']}")
+    return regressions
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main(args) -> int:
+    # db.py reads these at import time
+    os.environ["DATABASE_URL"] = args.database_url
+    if args.no_cache:
+        os.environ["CACHE_ENABLED"] = "0"
+    if not args.admission:
+        os.environ["ADMISSION_ENABLED"] = "0"
+    import httpx
+    import profiling
+    from db import engine
+    from main import app
+
+    if not args.no_seed:
+        started = time.perf_counter()
+        await seed(args)
+        print(f"seeded {args.users} users / {args.loans} loans in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    selected = scenarios(args)
+    if args.only:
+        selected = {name: fn for name, fn in selected.items() if name in args.only}
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+    results = {
+        "meta": {
+            "revision": _git_revision(),
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "dialect": engine.dialect.name,
+            **{k: getattr(args, k) for k in ("users", "friends_per_user", "loans", "requests", "concurrency",
+                                             "seed", "no_cache", "admission", "base_url")},
+        },
+        "scenarios": {},
+    }
+    async with client:
+        for i, (name, fn) in enumerate(selected.items()):
+            results["scenarios"][name] = stats = await run_scenario(client, fn, args, args.seed + i)
+            print(f"{name:24} {stats['throughput_rps']:9.1f} rps  p50 {stats['p50_ms']:8.2f}  "
+                  f"p95 {stats['p95_ms']:8.2f}  p99 {stats['p99_ms']:8.2f} ms  errors {stats['errors']}",
+                  file=sys.stderr)
+    if not args.base_url:
+        # server-side view from the profiling middleware: queries and DB time per route
+        results["routes"] = {
+            f"{method} {route}": {
+                "requests": s.latency.count,
+                "queries_per_request": round(s.queries.sum / s.queries.count, 2) if s.queries.count else 0,
+                "db_ms_per_request": round(s.db_seconds * 1000 / s.latency.count, 3) if s.latency.count else 0,
+            }
+            for (method, route), s in sorted(profiling.routes.items())
+        }
+    await engine.dispose()
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2) + "\n")
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
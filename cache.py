@@ -0,0 +1,205 @@
+# app/cache.py
+import functools
+import inspect
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, Optional, Protocol
+
+from fastapi import Request, Response
+
+from conditional import Validator
+from db import pin_primary
+from responses import EncodedJSONResponse
+
+MISS = object()
+
+def user_tag(user_id: int) -> str:
+    return f"user:{user_id}"
+
+def loan_tag(loan_id: int) -> str:
+    return f"loan:{loan_id}"
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    stale_fills: int = 0  # fills dropped because a tag was invalidated while the handler ran
+
+class CacheBackend(Protocol):
+    """
+    Storage for the response cache. `snapshot()` is taken before the handler runs and handed
+    back to `set()`, which must drop the value if any of its tags was invalidated in between
+    (otherwise a read racing a write could re-cache pre-write data).
+    """
+    stats: CacheStats
+
+    async def get(self, key: str) -> Any: ...
+    async def snapshot(self) -> int: ...
+    async def set(self, key: str, value: Any, tags: Iterable[str], snapshot: int) -> None: ...
+    async def invalidate(self, *tags: str) -> None: ...
+    async def clear(self) -> None: ...
+
+class LRUBackend:
+    """In-process LRU with a per-entry TTL and a tag -> keys index for invalidation."""
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, tuple[float, Any, tuple[str, ...]]] = OrderedDict()
+        self._by_tag: dict[str, set[str]] = {}
+        self._seq = 0
+        self._invalidated: dict[str, int] = {}  # tag -> seq of its last invalidation
+        self._floor = 0  # snapshots older than this predate a prune of `_invalidated`
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return MISS
+        if entry[0] < time.monotonic():
+            self._drop(key)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return MISS
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry[1]
+
+    async def snapshot(self) -> int:
+        return self._seq
+
+    async def set(self, key: str, value: Any, tags: Iterable[str], snapshot: int) -> None:
+        tags = tuple(tags)
+        if snapshot < self._floor or any(self._invalidated.get(t, -1) > snapshot for t in tags):
+            self.stats.stale_fills += 1
+            return
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    async def invalidate(self, *tags: str) -> None:
+        self._seq += 1
+        for tag in tags:
+            self._invalidated[tag] = self._seq
+            for key in self._by_tag.pop(tag, ()):
+                if self._drop(key):
+                    self.stats.invalidations += 1
+        if len(self._invalidated) > 4 * self.maxsize:
+            self._invalidated.clear()
+            self._floor = self._seq
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._by_tag.clear()
+
+    def _drop(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[2]:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+        return True
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+
+backend: CacheBackend = LRUBackend(
+    maxsize=int(os.getenv("CACHE_MAXSIZE", "10000")),
+    ttl=float(os.getenv("CACHE_TTL", "30")),
+)
+
+def set_backend(new_backend: CacheBackend) -> None:
+    global backend
+    backend = new_backend
+
+async def invalidate(*tags: str) -> None:
+    """Call after the write has committed. Also pins the tags' reads to the primary (db.pin_primary)."""
+    pin_primary(*tags)
+    await backend.invalidate(*tags)
+
+def cached(
+    key: Callable[..., str],
+    tags: Callable[..., Iterable[str]],
+    validator: Optional[Callable[..., Awaitable[Optional[Validator]]]] = None,
+):
+    """
+    Read-through cache for a route handler. `key` and `tags` receive the handler's keyword
+    arguments (FastAPI always calls endpoints with keywords). Exceptions are not cached.
+
+    With `validator` (same arguments, returns a conditional.Validator or None when there is
+    nothing to validate, e.g. a 404) the route also answers conditional GETs. The validator is
+    cached alongside the payload; on a miss it is computed first, so a client that is up to
+    date gets its 304 without the handler running. Works with caching disabled too.
+    """
+    def decorator(handler):
+        if validator is not None:
+            return _conditional(handler, key, tags, validator)
+        if not CACHE_ENABLED:
+            return handler
+
+        @functools.wraps(handler)
+        async def wrapper(**kwargs):
+            cache_key = key(**kwargs)
+            value = await backend.get(cache_key)
+            if value is not MISS:
+                return _reply(value)
+            snapshot = await backend.snapshot()
+            value = await handler(**kwargs)
+            await backend.set(cache_key, value, tags(**kwargs), snapshot)
+            return _reply(value)
+
+        return wrapper
+
+    return decorator
+
+def _reply(value):
+    return value.fresh() if isinstance(value, EncodedJSONResponse) else value
+
+def _conditional(handler, key, tags, validator):
+    @functools.wraps(handler)
+    async def wrapper(_request: Request, _response: Response, **kwargs):
+        cache_key = key(**kwargs)
+        entry = await backend.get(cache_key) if CACHE_ENABLED else MISS
+        if entry is not MISS:
+            value, current = entry
+        else:
+            snapshot = await backend.snapshot()
+            current = await validator(**kwargs)
+            if current is not None and current.matches(_request):
+                return Response(status_code=304, headers=current.headers())
+            value = await handler(**kwargs)
+            if CACHE_ENABLED:
+                await backend.set(cache_key, (value, current), tags(**kwargs), snapshot)
+        if current is None:
+            return _reply(value)
+        if current.matches(_request):
+            return Response(status_code=304, headers=current.headers())
+        if isinstance(value, EncodedJSONResponse):
+            return value.fresh(current.headers())
+        _response.headers.update(current.headers())
+        return value
+
+    # FastAPI reads the handler's signature (via __wrapped__); add the request/response it injects.
+    signature = inspect.signature(handler)
+    wrapper.__signature__ = signature.replace(parameters=[
+        *signature.parameters.values(),
+        inspect.Parameter("_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+        inspect.Parameter("_response", inspect.Parameter.KEYWORD_ONLY, annotation=Response),
+    ])
+    return wrapper
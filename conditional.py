@@ -0,0 +1,54 @@
+# app/conditional.py
+"""
+Validators for conditional GETs. A route's validator is computed from a small aggregate
+query (versions / modification times), so If-None-Match / If-Modified-Since can be answered
+with 304 without loading or serialising the rows. Wired into routes through cache.cached.
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+
+@dataclass(frozen=True)
+class Validator:
+    etag: str
+    last_modified: Optional[datetime] = None  # naive UTC, like every timestamp in models.py
+
+    def headers(self) -> dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+        return headers
+
+    def matches(self, request: Request) -> bool:
+        """True when the client's copy is current; If-None-Match takes precedence (RFC 9110 13.2.2)."""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+            return "*" in tags or self.etag.removeprefix("W/") in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None or self.last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            return False
+        return self.last_modified.replace(microsecond=0) <= since.astimezone(timezone.utc).replace(tzinfo=None)
+
+def validator(*parts, last_modified: Optional[datetime] = None) -> Validator:
+    """Weak ETag over `parts` (anything with a stable repr)."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return Validator(etag=f'W/"{digest}"', last_modified=last_modified)
+
+def status_day_start(last_modified: Optional[datetime]) -> datetime:
+    """
+    Last-Modified for payloads that show the read-side OVERDUE status: a loan can turn
+    overdue at midnight without any write, so never report a time before today began.
+    """
+    midnight = datetime.combine(datetime.utcnow().date(), time.min)
+    return midnight if last_modified is None else max(last_modified, midnight)
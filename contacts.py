@@ -0,0 +1,23 @@
+# app/contacts.py
+"""
+Contact hashes used for friend discovery: the app uploads SHA-256 digests of the address
+book instead of raw emails and phone numbers, and the server matches them against the
+digests stored on `users`. Both sides must normalise identically before hashing.
+"""
+import hashlib
+import re
+from typing import Optional
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+def normalize_phone(phone: str) -> str:
+    # Digits only, keeping a leading '+': "+212 6-12 34 56 78" -> "+212612345678".
+    phone = phone.strip()
+    return ("+" if phone.startswith("+") else "") + re.sub(r"\D", "", phone)
+
+def contact_hash(value: Optional[str], normalize) -> Optional[str]:
+    """Lowercase hex SHA-256 of the normalised value; None stays None."""
+    if value is None:
+        return None
+    return hashlib.sha256(normalize(value).encode()).hexdigest()
@@ -1,16 +1,201 @@
 # app/db.py
+from fastapi import Request
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import asyncio
+import logging
 import os
+import time
+
+from metrics import Histogram
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://zack:@localhost/newdb")
+# Optional streaming replica for read-only routes (see get_read_session).
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+
+# Pool sizing; DB_POOL_RECYCLE=-1 disables recycling.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))  # asyncpg prepared statements per connection
+REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", str(POOL_SIZE)))
+REPLICA_MAX_OVERFLOW = int(os.getenv("DB_REPLICA_MAX_OVERFLOW", str(POOL_MAX_OVERFLOW)))
+REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "10"))  # seconds behind before reads go back to the primary
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+# Read-your-writes window after a write. A replica counts as healthy up to REPLICA_MAX_LAG behind,
+# and lag can grow for a whole check interval before anyone notices, so a shorter pin would send
+# reads to a replica that may not have the write yet (and cache what it returns).
+# Pins live in each process: they cover reads served by the worker that took the write.
+PRIMARY_PIN_SECONDS = float(os.getenv("DB_PRIMARY_PIN_SECONDS", str(REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL)))
+if DATABASE_REPLICA_URL and PRIMARY_PIN_SECONDS < REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL:
+    raise ValueError(
+        f"DB_PRIMARY_PIN_SECONDS ({PRIMARY_PIN_SECONDS}) must be at least "
+        f"DB_REPLICA_MAX_LAG + DB_REPLICA_CHECK_INTERVAL ({REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL})"
+    )
+
+log = logging.getLogger(__name__)
+
+pool_wait = Histogram()
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited (queueing plus any new connect)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - started)
 
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+def _engine_options(url: str, pool_size: int = POOL_SIZE, max_overflow: int = POOL_MAX_OVERFLOW,
+                    poolclass=InstrumentedPool) -> dict:
+    options = dict(
+        poolclass=poolclass,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+    )
+    if url.startswith("postgresql+asyncpg"):
+        options["connect_args"] = {"prepared_statement_cache_size": STATEMENT_CACHE_SIZE}
+    return options
+
+engine = create_async_engine(DATABASE_URL, echo=False, future=True, **_engine_options(DATABASE_URL))
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+replica_engine = None
+ReplicaSessionLocal = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(DATABASE_REPLICA_URL, echo=False, future=True, **_engine_options(
+        DATABASE_REPLICA_URL, REPLICA_POOL_SIZE, REPLICA_MAX_OVERFLOW, poolclass=AsyncAdaptedQueuePool,
+    ))
+    ReplicaSessionLocal = async_sessionmaker(replica_engine, expire_on_commit=False, class_=AsyncSession)
+
 class Base(DeclarativeBase):
     pass
 
 async def get_session() -> AsyncSession:
+    # AsyncSession only checks a connection out of the pool on its first statement,
+    # so handlers answered from cache never touch the pool.
     async with SessionLocal() as session:
         yield session
+
+class ReplicaState:
+    """Replica health as seen by monitor_replica() and by connection errors, plus routing counters."""
+
+    def __init__(self):
+        self.healthy = True
+        self.lag_seconds = None
+        self.checked_at = None
+        self.reads = {"replica": 0, "pinned": 0, "unhealthy": 0}  # read sessions by where they went
+        self._pins: dict[str, float] = {}
+
+    def pin(self, *keys: str) -> None:
+        until = time.monotonic() + PRIMARY_PIN_SECONDS
+        for key in keys:
+            self._pins[key] = until
+        if len(self._pins) > 10_000:
+            now = time.monotonic()
+            self._pins = {k: t for k, t in self._pins.items() if t > now}
+
+    def pinned(self, keys) -> bool:
+        now = time.monotonic()
+        return any(self._pins.get(key, 0) > now for key in keys)
+
+replica = ReplicaState()
+
+def pin_primary(*keys: str) -> None:
+    """
+    Sends reads of these keys (cache tags, e.g. "user:3") to the primary for
+    DB_PRIMARY_PIN_SECONDS, so a client reads its own write despite replication lag.
+    cache.invalidate() calls this after every committed write. Pins are per process, like
+    the response cache: with several workers, a read that lands on another worker than the
+    write is only covered by the DB_REPLICA_MAX_LAG health threshold.
+    """
+    if replica_engine is not None:
+        replica.pin(*keys)
+
+def read_sessionmaker(*keys: str) -> async_sessionmaker:
+    """The replica, unless it is missing, unhealthy, or one of `keys` was written recently."""
+    if ReplicaSessionLocal is None:
+        return SessionLocal
+    if not replica.healthy:
+        replica.reads["unhealthy"] += 1
+        return SessionLocal
+    if replica.pinned(keys):
+        replica.reads["pinned"] += 1
+        return SessionLocal
+    replica.reads["replica"] += 1
+    return ReplicaSessionLocal
+
+# Path parameters that name a pinnable resource, formatted like cache.user_tag / cache.loan_tag.
+_PIN_KEYS = {"user_id": "user:{}", "other_id": "user:{}", "loan_id": "loan:{}"}
+
+async def get_read_session(request: Request) -> AsyncSession:
+    """get_session for read-only handlers; may be served by the replica."""
+    keys = [fmt.format(request.path_params[name]) for name, fmt in _PIN_KEYS.items() if name in request.path_params]
+    async with read_sessionmaker(*keys)() as session:
+        yield session
+
+if replica_engine is not None:
+    @event.listens_for(replica_engine.sync_engine, "handle_error")
+    def _replica_error(context):
+        # Lost or refused connections take the replica out of rotation until the next good check.
+        if context.is_disconnect or context.connection is None:
+            replica.healthy = False
+
+async def check_replica() -> None:
+    try:
+        async with replica_engine.connect() as conn:
+            if replica_engine.dialect.name == "postgresql":
+                # 0 when everything received has been replayed; NULL on a server that is not a standby.
+                lag = await conn.scalar(text(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+                    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                ))
+            else:
+                lag = await conn.scalar(text("SELECT 0"))
+    except Exception:
+        log.warning("replica health check failed", exc_info=True)
+        replica.healthy, replica.lag_seconds = False, None
+    else:
+        replica.lag_seconds = None if lag is None else float(lag)
+        replica.healthy = replica.lag_seconds is None or replica.lag_seconds <= REPLICA_MAX_LAG
+    replica.checked_at = time.time()
+
+async def monitor_replica(interval: float = REPLICA_CHECK_INTERVAL) -> None:
+    while True:
+        await check_replica()
+        await asyncio.sleep(interval)
+
+def replica_stats() -> dict:
+    if replica_engine is None:
+        return {"configured": False}
+    pool = replica_engine.pool
+    return {
+        "configured": True,
+        "healthy": replica.healthy,
+        "lag_seconds": replica.lag_seconds,
+        "checked_at": replica.checked_at,
+        "reads": dict(replica.reads),
+        "pinned_keys": sum(t > time.monotonic() for t in replica._pins.values()),
+        "pool": {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": max(0, pool.overflow())},
+    }
+
+def pool_stats() -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # QueuePool.overflow() counts down from -pool_size while below capacity
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "timeout": POOL_TIMEOUT,
+        "wait_seconds": pool_wait.snapshot(),
+    }
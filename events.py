@@ -0,0 +1,171 @@
+# app/events.py
+"""
+Change feed for the mobile app: loan / confirmation / friendship events pushed to the users
+they concern (see routers/events.py), instead of the app polling the dashboard.
+
+Handlers call `publish(session, ...)` before committing. Events are delivered only if the
+transaction commits: in-process they are dispatched from an after_commit hook; with
+EVENTS_PG_FANOUT=1 they travel as pg_notify() inside the transaction, and every worker
+(this one included) dispatches what its LISTEN connection receives.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import secrets
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+PG_FANOUT = os.getenv("EVENTS_PG_FANOUT", "0") == "1"
+CHANNEL = "loan_events"
+HISTORY_SIZE = int(os.getenv("EVENTS_HISTORY_SIZE", "5000"))  # events kept for Last-Event-ID resume
+QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))  # per connection; overflowing drops the connection
+MAX_CONNECTIONS = int(os.getenv("EVENTS_MAX_CONNECTIONS", "1000"))
+MAX_CONNECTIONS_PER_USER = int(os.getenv("EVENTS_MAX_CONNECTIONS_PER_USER", "5"))
+
+log = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Event:
+    id: str
+    type: str             # e.g. 'loan.created', 'loan.updated', 'confirmation.updated', 'friend.added'
+    users: tuple[int, ...]
+    data: dict
+
+    def to_json(self) -> str:
+        return json.dumps({"id": self.id, "type": self.type, "users": self.users, "data": self.data})
+
+    @classmethod
+    def from_json(cls, raw: str) -> "Event":
+        d = json.loads(raw)
+        return cls(id=d["id"], type=d["type"], users=tuple(d["users"]), data=d["data"])
+
+class Overloaded(Exception):
+    """Too many open feed connections (globally or for the user)."""
+
+class Subscription:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(QUEUE_SIZE)
+        self.dropped = False  # set when the consumer fell behind; the stream must end with a reset
+
+    def offer(self, event: Event) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped = True
+
+class EventBus:
+    def __init__(self):
+        self._origin = secrets.token_hex(4)
+        self._seq = itertools.count(1)
+        self._history: deque[Event] = deque(maxlen=HISTORY_SIZE)
+        self._subscribers: dict[int, set[Subscription]] = {}
+        self.connections = 0
+        self.dispatched = 0
+        self.dropped = 0
+
+    def next_id(self) -> str:
+        return f"{self._origin}-{next(self._seq)}"
+
+    def dispatch(self, event: Event) -> None:
+        self._history.append(event)
+        self.dispatched += 1
+        for user_id in event.users:
+            for sub in tuple(self._subscribers.get(user_id, ())):
+                sub.offer(event)
+                if sub.dropped:
+                    self.dropped += 1
+                    self.unsubscribe(sub)
+
+    def check_capacity(self, user_id: int) -> None:
+        """Raises Overloaded when subscribe() would, without subscribing."""
+        if self.connections >= MAX_CONNECTIONS or len(self._subscribers.get(user_id, ())) >= MAX_CONNECTIONS_PER_USER:
+            raise Overloaded
+
+    def subscribe(self, user_id: int, last_event_id: Optional[str] = None) -> tuple[Subscription, bool]:
+        """
+        Returns the subscription and whether the client must resync (its last event id is no
+        longer in history, or the replay would not fit in its queue).
+        """
+        self.check_capacity(user_id)
+        sub = Subscription(user_id)
+        resync = False
+        if last_event_id is not None:
+            ids = [e.id for e in self._history]
+            if last_event_id in ids:
+                for e in itertools.islice(self._history, ids.index(last_event_id) + 1, None):
+                    if user_id in e.users:
+                        sub.offer(e)
+                resync = sub.dropped
+                if resync:
+                    sub = Subscription(user_id)
+            else:
+                resync = True
+        self._subscribers.setdefault(user_id, set()).add(sub)
+        self.connections += 1
+        return sub, resync
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._subscribers.get(sub.user_id)
+        if subs and sub in subs:
+            subs.discard(sub)
+            self.connections -= 1
+            if not subs:
+                del self._subscribers[sub.user_id]
+
+bus = EventBus()
+
+def event_for(type: str, users, **data) -> Event:
+    return Event(id=bus.next_id(), type=type, users=tuple(sorted(set(users))), data=data)
+
+async def publish(session: AsyncSession, *evs: Event) -> None:
+    """Queues events on the session's transaction; delivered after commit, dropped on rollback."""
+    if not evs:
+        return
+    if PG_FANOUT:
+        # One round trip for a whole batch; NOTIFY payloads are queued until COMMIT.
+        await session.execute(
+            text("SELECT pg_notify(:channel, p) FROM unnest(CAST(:payloads AS text[])) AS p"),
+            {"channel": CHANNEL, "payloads": [ev.to_json() for ev in evs]},
+        )
+    else:
+        session.sync_session.info.setdefault("pending_events", []).extend(evs)
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_committed(session):
+    for ev in session.info.pop("pending_events", ()):
+        bus.dispatch(ev)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    session.info.pop("pending_events", None)
+
+async def listen(database_url: str, retry_delay: float = 5.0) -> None:
+    """EVENTS_PG_FANOUT: LISTEN on a dedicated asyncpg connection and dispatch locally; reconnects."""
+    import asyncpg
+
+    dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+    while True:
+        try:
+            conn = await asyncpg.connect(dsn)
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda _conn: closed.set())
+            await conn.add_listener(CHANNEL, lambda _conn, _pid, _channel, payload: bus.dispatch(Event.from_json(payload)))
+            log.info("events: listening on %r", CHANNEL)
+            try:
+                await closed.wait()
+            finally:
+                await conn.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("events: LISTEN connection failed")
+        await asyncio.sleep(retry_delay)
@@ -0,0 +1,96 @@
+# app/friend_graph.py
+from collections import Counter, OrderedDict
+import os
+import time
+
+from sqlalchemy import select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import UserFriend
+
+class FriendGraph:
+    """
+    In-process adjacency cache (user id -> friend ids) backing the mutual-friends and
+    suggestion endpoints. Entries are loaded lazily in one batched query, evicted LRU,
+    and invalidated by the friendship write endpoints after they commit.
+
+    Invalidation only reaches this process, so entries also expire after `ttl` seconds,
+    which bounds how long another worker's write stays invisible here. As in cache.py, a
+    load that raced an invalidation of one of its users is returned but not stored.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._adj: OrderedDict[int, tuple[float, frozenset[int]]] = OrderedDict()  # user -> (expires, friends)
+        self._seq = 0
+        self._invalidated: dict[int, int] = {}  # user -> seq of its last invalidation
+        self._floor = 0  # loads started before this predate a prune of `_invalidated`
+
+    def invalidate(self, *user_ids: int) -> None:
+        self._seq += 1
+        for user_id in user_ids:
+            self._adj.pop(user_id, None)
+            self._invalidated[user_id] = self._seq
+        if len(self._invalidated) > 4 * self.maxsize:
+            self._invalidated.clear()
+            self._floor = self._seq
+
+    def clear(self) -> None:
+        self._adj.clear()
+
+    def _get(self, user_id: int, now: float):
+        entry = self._adj.get(user_id)
+        if entry is None or entry[0] < now:
+            return None
+        self._adj.move_to_end(user_id)
+        return entry[1]
+
+    async def neighbours(self, session: AsyncSession, *user_ids: int) -> dict[int, frozenset[int]]:
+        now = time.monotonic()
+        out = {}
+        for user_id in user_ids:
+            friends = self._get(user_id, now)
+            if friends is not None:
+                out[user_id] = friends
+        missing = [u for u in set(user_ids) if u not in out]
+        if missing:
+            snapshot = self._seq
+            # both directions of the canonical pair, each branch on its own index
+            edges = union_all(
+                select(UserFriend.user_id, UserFriend.friend_id).where(UserFriend.user_id.in_(missing)),
+                select(UserFriend.friend_id, UserFriend.user_id).where(UserFriend.friend_id.in_(missing)),
+            )
+            loaded: dict[int, set[int]] = {u: set() for u in missing}
+            for user_id, friend_id in (await session.execute(edges)).all():
+                loaded[user_id].add(friend_id)
+            expires = time.monotonic() + self.ttl
+            for user_id, friends in loaded.items():
+                out[user_id] = frozenset(friends)
+                if snapshot >= self._floor and self._invalidated.get(user_id, -1) <= snapshot:
+                    self._adj[user_id] = (expires, out[user_id])
+                    self._adj.move_to_end(user_id)
+            while len(self._adj) > self.maxsize:
+                self._adj.popitem(last=False)
+        return out
+
+    async def mutual(self, session: AsyncSession, user_id: int, other_id: int) -> frozenset[int]:
+        adj = await self.neighbours(session, user_id, other_id)
+        return adj[user_id] & adj[other_id]
+
+    async def suggestions(self, session: AsyncSession, user_id: int, limit: int) -> list[tuple[int, int]]:
+        """Friends of friends ranked by number of mutual friends: [(user_id, mutual_count), ...]."""
+        friends = (await self.neighbours(session, user_id))[user_id]
+        if not friends:
+            return []
+        counts: Counter[int] = Counter()
+        for fof in (await self.neighbours(session, *friends)).values():
+            counts.update(fof)
+        for excluded in (user_id, *friends):
+            counts.pop(excluded, None)
+        return sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+
+graph = FriendGraph(
+    maxsize=int(os.getenv("FRIEND_GRAPH_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("FRIEND_GRAPH_TTL", "30")),
+)
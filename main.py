@@ -1,16 +1,56 @@
 # app/main.py
+import asyncio
 from fastapi import FastAPI
 from routers import loans
 from routers import users
-from db import engine, Base
+from routers import exports
+from routers import internal
+from routers import metrics
+from routers import events as event_stream
+import events
+from db import DATABASE_URL, engine, monitor_replica, replica_engine
+import migrations
+from admission import AdmissionMiddleware
+from profiling import ProfilingMiddleware, install_sql_hooks
+from workers import archive, notifications, outbox, overdue
 
 app = FastAPI(title="HedNiya API", version="0.1.0")
+# Added first, so it runs inside ProfilingMiddleware and shed requests still show up in its stats.
+app.add_middleware(AdmissionMiddleware, routers=[loans.router, users.router, exports.router, event_stream.router])
+app.add_middleware(ProfilingMiddleware)
+install_sql_hooks(engine)
+if replica_engine is not None:
+    install_sql_hooks(replica_engine)
+
+_background: list[asyncio.Task] = []
 
 @app.on_event("startup")
 async def on_startup():
-    # Simple, dev-only auto-migrate; replace with Alembic in prod.
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # One version check when the schema is current; see migrations.py for deploy-time upgrades.
+    await migrations.ensure_current()
+    if overdue.SWEEP_INTERVAL > 0:
+        _background.append(asyncio.create_task(overdue.run()))
+    if archive.ARCHIVE_INTERVAL > 0:
+        _background.append(asyncio.create_task(archive.run()))
+    if notifications.DISPATCH_INTERVAL > 0 and notifications.transports:
+        _background.append(asyncio.create_task(notifications.run()))
+    if outbox.ledger is not None:
+        _background.append(asyncio.create_task(outbox.run(outbox.ledger)))
+    if replica_engine is not None:
+        _background.append(asyncio.create_task(monitor_replica()))
+    if events.PG_FANOUT:
+        _background.append(asyncio.create_task(events.listen(DATABASE_URL)))
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in _background:
+        task.cancel()
+    await asyncio.gather(*_background, return_exceptions=True)
+    _background.clear()
 
 app.include_router(loans.router)
 app.include_router(users.router)
+app.include_router(exports.router)
+app.include_router(internal.router)
+app.include_router(metrics.router)
+app.include_router(event_stream.router)
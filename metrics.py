@@ -0,0 +1,60 @@
+# app/metrics.py
+from bisect import bisect_left
+
+# seconds; wide enough for both pool waits and request latencies
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus semantics; an observe is a bisect and three adds."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        out, running = [], 0
+        for bound, n in zip((*map(str, self.buckets), "+Inf"), self.counts):
+            running += n
+            out.append((bound, running))
+        return out
+
+    def snapshot(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "buckets": dict(self.cumulative())}
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+class PrometheusWriter:
+    """Builds a Prometheus text-format (0.0.4) exposition."""
+
+    def __init__(self):
+        self.lines: list[str] = []
+
+    def metric(self, name: str, kind: str, help: str, samples) -> None:
+        """`samples`: iterable of (labels dict, value)."""
+        self.lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        self.lines += [f"{name}{_labels(labels)} {value}" for labels, value in samples]
+
+    def histogram(self, name: str, help: str, series) -> None:
+        """`series`: iterable of (labels dict, Histogram)."""
+        self.lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+        for labels, hist in series:
+            for bound, count in hist.cumulative():
+                self.lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+            self.lines.append(f"{name}_sum{_labels(labels)} {hist.sum}")
+            self.lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
@@ -0,0 +1,276 @@
+# app/migrations.py
+"""
+Versioned schema migrations, recorded in `schema_migrations` (version, name, checksum).
+
+On startup `ensure_current()` reads that table once and returns if nothing is pending.
+Otherwise one process migrates under a Postgres advisory lock; the others wait on the lock,
+re-read the table and find nothing left to do. To keep migrations out of worker boot
+altogether, run them before deploying and start the workers with DB_AUTO_MIGRATE=0
+(a pending migration then fails startup instead of running):
+
+    python migrations.py upgrade
+    python migrations.py status    # exit 1 when migrations are pending
+
+Migration 1 creates every missing table from the models, so a new database gets the whole
+current schema there. The later ones bring databases created by the old startup
+`create_all` up to date, and each of their steps is a no-op when its change is already in
+place. Changes to existing tables go in a new migration at the end of MIGRATIONS; applied
+migrations must not be edited, their checksum is verified on every check.
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, bindparam, func, insert, inspect,
+    or_, select, text, update,
+)
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+from sqlalchemy.schema import AddConstraint, CreateColumn
+
+import balances
+from contacts import contact_hash, normalize_email, normalize_phone
+from db import Base, engine
+from models import Confirmation, Loan, Notification, User, UserFriend
+
+AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+LOCK_KEY = int(os.getenv("DB_MIGRATION_LOCK_KEY", "4815162342"))  # pg_advisory_lock key
+BACKFILL_BATCH_SIZE = 1000
+
+log = logging.getLogger(__name__)
+
+# Own metadata: the runner manages this table, create_all in migration 1 doesn't.
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(128), nullable=False),
+    Column("checksum", String(64), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+class MigrationError(RuntimeError):
+    pass
+
+@dataclass(frozen=True)
+class Step:
+    description: str  # what the checksum covers
+    apply: Callable[[AsyncConnection], Awaitable[None]]
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    steps: tuple[Step, ...]
+
+    @property
+    def checksum(self) -> str:
+        source = "\n".join([f"{self.version} {self.name}", *(s.description for s in self.steps)])
+        return hashlib.sha256(source.encode()).hexdigest()
+
+# === Steps ===
+def _create_tables() -> Step:
+    async def apply(conn: AsyncConnection) -> None:
+        await conn.run_sync(Base.metadata.create_all)
+    return Step("create missing tables", apply)
+
+def _sql(statement: str, postgresql_only: bool = False) -> Step:
+    statement = " ".join(statement.split())
+
+    async def apply(conn: AsyncConnection) -> None:
+        if not postgresql_only or conn.dialect.name == "postgresql":
+            await conn.execute(text(statement))
+    return Step(statement, apply)
+
+def _add_columns(table: Table, *names: str) -> Step:
+    columns = [table.c[name] for name in names]
+
+    async def apply(conn: AsyncConnection) -> None:
+        existing = await conn.run_sync(lambda c: {col["name"] for col in inspect(c).get_columns(table.name)})
+        for column in columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                await conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+    return Step(f"add columns {table.name}: " + ", ".join(f"{c.name} {c.type}" for c in columns), apply)
+
+def _create_indexes(table: Table, *names: str) -> Step:
+    indexes = [next(i for i in table.indexes if i.name == name) for name in names]
+
+    async def apply(conn: AsyncConnection) -> None:
+        for index in indexes:
+            await conn.run_sync(lambda c, index=index: index.create(c, checkfirst=True))
+    return Step(f"create indexes on {table.name}: " + ", ".join(names), apply)
+
+def _add_constraints(table: Table, *names: str) -> Step:
+    constraints = [next(c for c in table.constraints if c.name == name) for name in names]
+
+    async def apply(conn: AsyncConnection) -> None:
+        if conn.dialect.name != "postgresql":
+            return  # SQLite can't add constraints to a table; its dev databases get them from create_all
+        existing = await conn.run_sync(lambda c: {
+            con["name"] for con in inspect(c).get_unique_constraints(table.name) + inspect(c).get_check_constraints(table.name)
+        })
+        for constraint in constraints:
+            if constraint.name not in existing:
+                await conn.execute(AddConstraint(constraint))
+    return Step(f"add constraints on {table.name}: " + ", ".join(names), apply)
+
+async def _backfill_contact_hashes(conn: AsyncConnection) -> None:
+    users = User.__table__
+    stmt = update(users).where(users.c.id == bindparam("_id")).values(
+        email_sha256=bindparam("_email"), phone_sha256=bindparam("_phone"),
+    )
+    last_id = 0
+    while True:
+        rows = (
+            await conn.execute(
+                select(users.c.id, users.c.email, users.c.phone)
+                .where(users.c.id > last_id, or_(
+                    users.c.email.isnot(None) & users.c.email_sha256.is_(None),
+                    users.c.phone.isnot(None) & users.c.phone_sha256.is_(None),
+                ))
+                .order_by(users.c.id)
+                .limit(BACKFILL_BATCH_SIZE)
+            )
+        ).all()
+        if not rows:
+            return
+        await conn.execute(stmt, [
+            {"_id": r.id, "_email": contact_hash(r.email, normalize_email), "_phone": contact_hash(r.phone, normalize_phone)}
+            for r in rows
+        ])
+        last_id = rows[-1].id
+
+async def _rebuild_balances(conn: AsyncConnection) -> None:
+    # the session joins the migration's transaction; its commit doesn't end it
+    async with AsyncSession(bind=conn) as session:
+        await balances.rebuild(session)
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "baseline", (_create_tables(),)),
+    Migration(2, "canonical friendships", (
+        _sql("DELETE FROM user_friends WHERE user_id = friend_id"),
+        _sql("""
+            DELETE FROM user_friends WHERE id NOT IN (
+                SELECT min(id) FROM user_friends
+                GROUP BY CASE WHEN user_id < friend_id THEN user_id ELSE friend_id END,
+                         CASE WHEN user_id < friend_id THEN friend_id ELSE user_id END
+            )
+        """),
+        _sql("UPDATE user_friends SET user_id = friend_id, friend_id = user_id WHERE user_id > friend_id"),
+        _add_constraints(UserFriend.__table__, "uq_user_friends_pair", "ck_user_friends_canonical"),
+        _sql("DROP INDEX IF EXISTS ix_user_friends_user_id"),  # covered by uq_user_friends_pair
+    )),
+    Migration(3, "repayments and optimistic versions", (
+        _add_columns(Loan.__table__, "repaid_amount", "version"),
+        _add_columns(Confirmation.__table__, "version"),
+        _sql("ALTER TABLE hedera_logs ALTER COLUMN event_id DROP NOT NULL", postgresql_only=True),
+    )),
+    Migration(4, "dashboard and pending-work indexes", (
+        _create_indexes(Loan.__table__, "ix_loans_lender_status", "ix_loans_borrower_status"),
+        _create_indexes(Notification.__table__, "ix_notifications_pending"),
+    )),
+    Migration(5, "user balances", (Step("rebuild user_balances", _rebuild_balances),)),
+    Migration(6, "user contact hashes and updated_at", (
+        _add_columns(User.__table__, "updated_at", "email_sha256", "phone_sha256"),
+        _create_indexes(User.__table__, "ix_users_email_sha256", "ix_users_phone_sha256"),
+        Step("backfill users contact hashes", _backfill_contact_hashes),
+        _sql("UPDATE users SET updated_at = created_at WHERE updated_at IS NULL"),
+    )),
+)
+
+HEAD = MIGRATIONS[-1].version
+
+# === Runner ===
+async def applied(conn: AsyncConnection) -> dict[int, str]:
+    """version -> checksum of the applied migrations; empty before the first run."""
+    try:
+        rows = (await conn.execute(select(schema_migrations.c.version, schema_migrations.c.checksum))).all()
+    except (ProgrammingError, OperationalError):  # no schema_migrations table yet
+        await conn.rollback()
+        return {}
+    return {r.version: r.checksum for r in rows}
+
+def pending(done: dict[int, str]) -> list[Migration]:
+    """
+    Migrations still to apply, in order. Versions this code doesn't know (applied by a newer
+    deploy) are ignored: migrations only add, so the old code keeps working during a rollout.
+    """
+    for migration in MIGRATIONS:
+        if migration.version in done and done[migration.version] != migration.checksum:
+            raise MigrationError(f"migration {migration.version} ({migration.name}) changed after it was applied")
+    return [m for m in MIGRATIONS if m.version not in done]
+
+async def upgrade(bind: AsyncEngine = engine) -> list[Migration]:
+    """
+    Applies pending migrations, one transaction each, holding the advisory lock throughout
+    (session-level, so it survives the per-migration commits). Returns what it applied.
+    """
+    async with bind.connect() as conn:
+        locked = conn.dialect.name == "postgresql"
+        if locked:
+            await conn.execute(select(func.pg_advisory_lock(LOCK_KEY)))
+            await conn.commit()
+        try:
+            async with conn.begin():
+                await conn.run_sync(lambda c: schema_migrations.create(c, checkfirst=True))
+            todo = pending(await applied(conn))
+            await conn.commit()
+            for migration in todo:
+                async with conn.begin():
+                    for step in migration.steps:
+                        await step.apply(conn)
+                    await conn.execute(insert(schema_migrations).values(
+                        version=migration.version, name=migration.name,
+                        checksum=migration.checksum, applied_at=datetime.utcnow(),
+                    ))
+                log.info("migrations: applied %d (%s)", migration.version, migration.name)
+            return todo
+        finally:
+            if locked:
+                await conn.execute(select(func.pg_advisory_unlock(LOCK_KEY)))
+                await conn.commit()
+
+async def ensure_current(bind: AsyncEngine = engine, auto_migrate: bool = AUTO_MIGRATE) -> None:
+    """Startup check: one read of schema_migrations when the schema is current."""
+    async with bind.connect() as conn:
+        todo = pending(await applied(conn))
+    if not todo:
+        return
+    if not auto_migrate:
+        raise MigrationError(
+            f"{len(todo)} pending migration(s) up to version {HEAD}; run `python migrations.py upgrade`"
+        )
+    await upgrade(bind)
+
+async def _main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Apply or list schema migrations.")
+    parser.add_argument("command", choices=("upgrade", "status"))
+    args = parser.parse_args(argv)
+    logging.basicConfig(format="%(message)s")
+    log.setLevel(logging.INFO)
+
+    try:
+        if args.command == "upgrade":
+            done = await upgrade()
+            print(f"{len(done)} migration(s) applied; schema at version {HEAD}")
+            return 0
+        async with engine.connect() as conn:
+            done = await applied(conn)
+        todo = pending(done)
+        for migration in MIGRATIONS:
+            state = "pending" if migration in todo else "applied"
+            print(f"{migration.version:>4}  {migration.name:<40} {state}")
+        print(f"{len(todo)} pending")
+        return 1 if todo else 0
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
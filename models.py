@@ -6,11 +6,13 @@ from typing import Optional
 
 from sqlalchemy import (
     String, Integer, DateTime, Date, Enum, ForeignKey, Boolean,
-    Numeric, JSON, UniqueConstraint, Index
+    Numeric, JSON, UniqueConstraint, Index, CheckConstraint, Column, Table
 )
-from sqlalchemy.orm import relationship, Mapped, mapped_column
+from sqlalchemy.sql import text
+from sqlalchemy.orm import relationship, Mapped, mapped_column, validates
 import enum
 
+from contacts import contact_hash, normalize_email, normalize_phone
 from db import Base
 
 # === Enums aligned with CDC HedNiya ===
@@ -42,16 +44,31 @@ class User(Base):
     photo_url: Mapped[Optional[str]] = mapped_column(String(512))
     is_2fa_enabled: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # also bumped when the user's friendships change (feeds the ETag of GET /users/{id}/friends)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # SHA-256 of the normalised email / phone (see contacts.py), for contact matching
+    email_sha256: Mapped[Optional[str]] = mapped_column(String(64), index=True)
+    phone_sha256: Mapped[Optional[str]] = mapped_column(String(64), index=True)
+
+    @validates("email", "phone")
+    def _hash_contact(self, key, value):
+        normalize = normalize_email if key == "email" else normalize_phone
+        setattr(self, f"{key}_sha256", contact_hash(value, normalize))
+        return value
 
     # relationships
     loans_lent: Mapped[list["Loan"]] = relationship(foreign_keys="Loan.lender_id", back_populates="lender")
     loans_borrowed: Mapped[list["Loan"]] = relationship(foreign_keys="Loan.borrower_id", back_populates="borrower")
 
 class UserFriend(Base):
+    """
+    Friendship is symmetric and stored once, as the canonical pair user_id < friend_id.
+    The unique (user_id, friend_id) index serves one direction, ix on friend_id the other.
+    """
     __tablename__ = "user_friends"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     friend_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
@@ -59,6 +76,11 @@ class UserFriend(Base):
     user: Mapped["User"] = relationship(foreign_keys=[user_id])
     friend: Mapped["User"] = relationship(foreign_keys=[friend_id])
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "friend_id", name="uq_user_friends_pair"),
+        CheckConstraint("user_id < friend_id", name="ck_user_friends_canonical"),
+    )
+
 class Loan(Base):
     __tablename__ = "loans"
 
@@ -77,9 +99,14 @@ class Loan(Base):
     borrower_confirmed: Mapped[bool] = mapped_column(Boolean, default=True)
     confirmed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
+    # Sum of finalized REPAYMENT confirmations; the loan closes when it reaches `amount`
+    repaid_amount: Mapped[Decimal] = mapped_column(Numeric(12, 2), default=Decimal("0"), server_default="0")
+
     created_by_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Optimistic concurrency: every UPDATE bumps it, conditional writes check it
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
 
     lender: Mapped[User] = relationship(foreign_keys=[lender_id], back_populates="loans_lent")
     borrower: Mapped[User] = relationship(foreign_keys=[borrower_id], back_populates="loans_borrowed")
@@ -88,8 +115,32 @@ class Loan(Base):
 
     __table_args__ = (
         Index("ix_loans_status_due_date", "status", "due_date"),
+        # dashboard: one index per side of the loan, `id` last for keyset pagination
+        Index("ix_loans_lender_status", "lender_id", "status", "id"),
+        Index("ix_loans_borrower_status", "borrower_id", "status", "id"),
     )
 
+class UserBalance(Base):
+    """
+    Running per-user, per-currency totals over outstanding (ACTIVE/OVERDUE) loans, so the
+    dashboard and profile read one row per currency instead of aggregating loan history.
+    Maintained by balances.py in the same transaction as every loan change;
+    `python balances.py verify|rebuild` checks it against `loans`.
+    """
+    __tablename__ = "user_balances"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    currency: Mapped[Currency] = mapped_column(Enum(Currency), primary_key=True)
+
+    lent_outstanding: Mapped[Decimal] = mapped_column(Numeric(14, 2), default=Decimal("0"))
+    borrowed_outstanding: Mapped[Decimal] = mapped_column(Numeric(14, 2), default=Decimal("0"))
+    overdue_amount: Mapped[Decimal] = mapped_column(Numeric(14, 2), default=Decimal("0"))  # either side
+    lent_count: Mapped[int] = mapped_column(Integer, default=0)
+    borrowed_count: Mapped[int] = mapped_column(Integer, default=0)
+    overdue_count: Mapped[int] = mapped_column(Integer, default=0)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Confirmation(Base):
     """
     Tracks any action requiring *both* parties' agreement:
@@ -109,9 +160,10 @@ class Confirmation(Base):
 
     lender_accepted: Mapped[bool] = mapped_column(Boolean, default=False)
     borrower_accepted: Mapped[bool] = mapped_column(Boolean, default=True)
-    finalized_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    finalized_at: Mapped[Optional[datetime]] = mapped_column(DateTime)  # set on acceptance by both or on rejection
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
 
     loan: Mapped[Loan] = relationship(back_populates="events")
 
@@ -124,7 +176,7 @@ class HederaLog(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     loan_id: Mapped[int] = mapped_column(ForeignKey("loans.id", ondelete="CASCADE"), index=True)
-    event_id: Mapped[int] = mapped_column(ForeignKey("confirmations.id", ondelete="SET NULL"))
+    event_id: Mapped[Optional[int]] = mapped_column(ForeignKey("confirmations.id", ondelete="SET NULL"))
 
     direction: Mapped[str] = mapped_column(String(3))  # 'A2B' or 'B2A'
     tx_id: Mapped[Optional[str]] = mapped_column(String(128))  # explorer reference
@@ -132,6 +184,32 @@ class HederaLog(Base):
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+class HederaOutbox(Base):
+    """
+    Transactional outbox for HederaLog: a row is written in the same transaction as the loan
+    change, and workers/outbox.py submits the transfer later and records the HederaLog,
+    so API latency never depends on the ledger.
+    """
+    __tablename__ = "hedera_outbox"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    loan_id: Mapped[int] = mapped_column(ForeignKey("loans.id", ondelete="CASCADE"), index=True)
+    event_id: Mapped[Optional[int]] = mapped_column(ForeignKey("confirmations.id", ondelete="SET NULL"))
+    kind: Mapped[str] = mapped_column(String(32))          # e.g., 'LOAN_CREATE', 'LOAN_CONFIRM'
+    direction: Mapped[str] = mapped_column(String(3))
+    payload: Mapped[dict] = mapped_column(JSON, default=dict)
+
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    last_error: Mapped[Optional[str]] = mapped_column(String(512))
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_hedera_outbox_pending", "next_attempt_at", postgresql_where=text("sent_at IS NULL")),
+    )
+
 class Notification(Base):
     """
     Scheduled reminders (push/SMS/email) per CDC:
@@ -149,3 +227,29 @@ class Notification(Base):
     sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
     payload: Mapped[dict] = mapped_column(JSON, default=dict)
+
+    __table_args__ = (
+        # what the dispatcher claims: unsent rows by due time, without walking delivered history
+        Index("ix_notifications_pending", "scheduled_at", postgresql_where=text("sent_at IS NULL")),
+    )
+
+# === Cold storage ===
+def _archive_table(table: Table, *indexes: tuple[str, ...]) -> Table:
+    """
+    `<table>_archive`: the same columns without foreign keys or defaults, filled by
+    workers/archive.py. Archived rows are never updated, so they only need read indexes.
+    """
+    name = f"{table.name}_archive"
+    return Table(
+        name, Base.metadata,
+        *(Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable, autoincrement=False)
+          for c in table.columns),
+        Column("archived_at", DateTime, nullable=False),
+        *(Index(f"ix_{name}_{'_'.join(cols)}", *cols) for cols in indexes),
+    )
+
+# the dashboard's closed history pages through these, like ix_loans_*_status on the hot table
+loans_archive = _archive_table(Loan.__table__, ("lender_id", "status", "id"), ("borrower_id", "status", "id"))
+confirmations_archive = _archive_table(Confirmation.__table__, ("loan_id",))
+hedera_logs_archive = _archive_table(HederaLog.__table__, ("loan_id",))
+notifications_archive = _archive_table(Notification.__table__, ("loan_id",))
@@ -0,0 +1,107 @@
+# app/profiling.py
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from metrics import Histogram
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "20"))  # queries per request
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+log = logging.getLogger(__name__)
+
+class RequestProfile:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+class RouteStats:
+    __slots__ = ("latency", "queries", "db_seconds", "statuses", "n_plus_one")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.statuses: dict[int, int] = {}
+        self.n_plus_one = 0
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+# (method, route template) -> stats
+routes: dict[tuple[str, str], RouteStats] = {}
+
+def install_sql_hooks(engine: AsyncEngine) -> None:
+    """Counts statements and their wall time against the request that issued them (if any)."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        if profile is not None and conn.info.get("query_started"):
+            profile.db_seconds += time.perf_counter() - conn.info["query_started"].pop()
+            profile.queries += 1
+
+class ProfilingMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware task/stream overhead) recording per-route
+    latency, query count and DB time, flagging likely N+1 requests and optionally adding a
+    Server-Timing header.
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING, n_plus_one_threshold: int = N_PLUS_ONE_THRESHOLD):
+        self.app = app
+        self.server_timing = server_timing
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    app_ms = (time.perf_counter() - started) * 1000
+                    timing = (
+                        f'db;dur={profile.db_seconds * 1000:.1f};desc="{profile.queries} queries", '
+                        f"app;dur={app_ms:.1f}"
+                    )
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            key = (scope["method"], getattr(route, "path", "<unmatched>"))
+            stats = routes.get(key)
+            if stats is None:
+                stats = routes[key] = RouteStats()
+            stats.latency.observe(time.perf_counter() - started)
+            stats.queries.observe(profile.queries)
+            stats.db_seconds += profile.db_seconds
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            if profile.queries >= self.n_plus_one_threshold:
+                stats.n_plus_one += 1
+                log.warning("%s %s issued %d queries (%.1f ms in DB): likely N+1",
+                            key[0], scope["path"], profile.queries, profile.db_seconds * 1000)
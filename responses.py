@@ -0,0 +1,28 @@
+# app/responses.py
+"""
+Pre-encoded JSON for the large read endpoints: rows are validated in one TypeAdapter pass and
+serialised by pydantic-core straight to bytes, skipping jsonable_encoder. Decimals come out as
+exact strings ("12.50") and dates / datetimes as ISO 8601, the same as response_model output.
+"""
+import functools
+from typing import Any, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+class EncodedJSONResponse(Response):
+    """A JSON body encoded ahead of time; cache.cached re-sends its bytes without re-encoding."""
+    media_type = "application/json"
+
+    def fresh(self, headers: Optional[dict[str, str]] = None) -> "EncodedJSONResponse":
+        # Starlette responses carry per-request state (headers, background tasks); reuse only the body.
+        return EncodedJSONResponse(self.body, status_code=self.status_code, headers=headers)
+
+@functools.cache
+def adapter(tp: Any) -> TypeAdapter:
+    return TypeAdapter(tp)
+
+def encoded(tp: Any, data: Any) -> EncodedJSONResponse:
+    """Validates `data` (dicts, rows or objects with attributes) as `tp` and encodes it."""
+    ta = adapter(tp)
+    return EncodedJSONResponse(ta.dump_json(ta.validate_python(data, from_attributes=True)))
@@ -0,0 +1,66 @@
+# app/routers/events.py
+import asyncio
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+import events
+
+HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))  # seconds between keep-alive comments
+
+router = APIRouter(tags=["events"])
+
+def _sse(event: events.Event) -> bytes:
+    return f"id: {event.id}\nevent: {event.type}\ndata: {event.to_json()}\n\n".encode()
+
+RESET = b"event: reset\ndata: {}\n\n"
+OVERLOADED = b"retry: 30000\n\n"  # reconnect in 30s, like the 503's Retry-After
+
+@router.get("/users/{user_id}/events")
+async def event_stream(
+    user_id: int,
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Server-Sent Events feed of loan, confirmation and friendship changes concerning the user.
+    Reconnect with Last-Event-ID to resume; a `reset` event means "refetch the dashboard",
+    sent when the gap can't be replayed or this connection fell too far behind.
+    """
+    try:
+        events.bus.check_capacity(user_id)
+    except events.Overloaded:
+        raise HTTPException(status_code=503, detail="Too many event streams", headers={"Retry-After": "30"})
+
+    async def stream():
+        # Subscribed only once the body is being sent: a response that never starts (client
+        # gone first) leaves nothing behind to count against the user's connection limit.
+        try:
+            sub, resync = events.bus.subscribe(user_id, last_event_id_header or last_event_id)
+        except events.Overloaded:  # filled up since the check above
+            yield OVERLOADED
+            return
+        try:
+            if resync:
+                yield RESET
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if sub.dropped:
+                        yield RESET
+                        return
+                    yield b": keep-alive\n\n"
+                    continue
+                yield _sse(event)
+                if sub.dropped and sub.queue.empty():
+                    yield RESET
+                    return
+        finally:
+            events.bus.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+    })
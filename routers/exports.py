@@ -0,0 +1,122 @@
+# app/routers/exports.py
+import csv
+import io
+import json
+import os
+from itertools import groupby
+from typing import AsyncIterator, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import user_tag
+from db import get_read_session, read_sessionmaker
+import models, schemas
+
+FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "1000"))  # rows per server-side cursor fetch
+
+router = APIRouter(tags=["exports"])
+
+LOAN_FIELDS = list(schemas.LoanOut.model_fields)
+
+# archived loans (workers/archive.py) are part of the history too
+ARCHIVES = {
+    models.Loan: models.loans_archive,
+    models.Confirmation: models.confirmations_archive,
+    models.HederaLog: models.hedera_logs_archive,
+}
+
+def _hot_and_archived(model, fields: list[str], where):
+    """One SELECT per table (hot, archive) for `where(table)`; same columns from both."""
+    return [
+        select(*(table.c[f] for f in fields)).where(where(table))
+        for table in (model.__table__, ARCHIVES[model])
+    ]
+
+def _user_loans(user_id: int):
+    # per-party branches, not `lender_id = X OR borrower_id = X`, as in routers/loans.py
+    loans = union_all(
+        *_hot_and_archived(models.Loan, LOAN_FIELDS, lambda t: t.c.lender_id == user_id),
+        *_hot_and_archived(models.Loan, LOAN_FIELDS, lambda t: t.c.borrower_id == user_id),
+    ).subquery()
+    return select(loans).order_by(loans.c.id)
+
+async def _children(session: AsyncSession, model, schema, loan_ids: list[int]) -> dict[int, list[dict]]:
+    children = union_all(
+        *_hot_and_archived(model, list(schema.model_fields), lambda t: t.c.loan_id.in_(loan_ids))
+    ).subquery()
+    rows = await session.execute(select(children).order_by(children.c.loan_id, children.c.id))
+    return {
+        loan_id: [schema.model_validate(r, from_attributes=True).model_dump(mode="json") for r in group]
+        for loan_id, group in groupby(rows, key=lambda r: r.loan_id)
+    }
+
+async def _records(user_id: int, include: set[str]) -> AsyncIterator[list[tuple[dict, dict]]]:
+    """
+    Yields one list per cursor fetch of (loan, children) pairs; children of a fetch are loaded
+    with one query per included table, so memory is bounded by FETCH_SIZE whatever the history.
+    """
+    async with read_sessionmaker(user_tag(user_id))() as session:
+        result = await session.stream(_user_loans(user_id).execution_options(yield_per=FETCH_SIZE))
+        async for loans in result.partitions():
+            ids = [loan.id for loan in loans]
+            confirmations = (
+                await _children(session, models.Confirmation, schemas.ConfirmationOut, ids)
+                if "confirmations" in include else {}
+            )
+            hedera_logs = (
+                await _children(session, models.HederaLog, schemas.HederaLogOut, ids)
+                if "hedera_logs" in include else {}
+            )
+            batch = []
+            for loan in loans:
+                children = {}
+                if "confirmations" in include:
+                    children["confirmations"] = confirmations.get(loan.id, [])
+                if "hedera_logs" in include:
+                    children["hedera_logs"] = hedera_logs.get(loan.id, [])
+                out = schemas.LoanOut.model_validate(loan, from_attributes=True).model_dump(mode="json")
+                batch.append((out, children))
+            yield batch
+
+async def _ndjson(user_id: int, include: set[str]) -> AsyncIterator[bytes]:
+    async for batch in _records(user_id, include):
+        yield "".join(json.dumps({**loan, **children}) + "\n" for loan, children in batch).encode()
+
+async def _csv(user_id: int, include: set[str]) -> AsyncIterator[bytes]:
+    # included children are JSON arrays in their own columns, keeping one row per loan
+    columns = LOAN_FIELDS + sorted(include)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for batch in _records(user_id, include):
+        for loan, children in batch:
+            row = {**loan, **{k: json.dumps(v) for k, v in children.items()}}
+            writer.writerow(["" if row[c] is None else row[c] for c in columns])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+@router.get("/users/{user_id}/loans/export")
+async def export_loans(
+    user_id: int,
+    format: Literal["csv", "ndjson"] = "ndjson",
+    include: list[Literal["confirmations", "hedera_logs"]] = Query(default=[]),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Streams the user's full loan history (as lender and borrower) through a server-side
+    cursor; optionally with each loan's confirmations and Hedera logs.
+    """
+    if await session.get(models.User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    await session.close()  # the stream runs on its own session; don't hold this connection meanwhile
+    body = _csv(user_id, set(include)) if format == "csv" else _ndjson(user_id, set(include))
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="loans-{user_id}.{format}"',
+    })
@@ -0,0 +1,44 @@
+# app/routers/internal.py
+from dataclasses import asdict
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import admission
+import cache
+import events
+from db import get_session, pool_stats, replica_stats
+from workers import outbox
+
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+@router.get("/outbox")
+async def outbox_stats(db: AsyncSession = Depends(get_session)):
+    """Hedera outbox throughput counters and current lag."""
+    return {**asdict(outbox.stats), **await outbox.pending_lag(db)}
+
+@router.get("/cache")
+async def cache_stats():
+    """Response cache hit/miss/eviction counters."""
+    return asdict(cache.backend.stats)
+
+@router.get("/pool")
+async def pool():
+    """Live connection pool gauges and the checkout wait histogram."""
+    return pool_stats()
+
+@router.get("/replica")
+async def replica():
+    """Read-replica health, lag and how reads were routed."""
+    return replica_stats()
+
+@router.get("/events")
+async def event_stats():
+    """Change-feed connection and dispatch counters."""
+    bus = events.bus
+    return {"connections": bus.connections, "dispatched": bus.dispatched, "dropped": bus.dropped,
+            "pg_fanout": events.PG_FANOUT}
+
+@router.get("/admission")
+async def admission_stats():
+    """Admitted / shed request counters and current in-flight requests."""
+    return admission.snapshot()
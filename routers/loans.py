@@ -1,15 +1,112 @@
 # app/routers/loans.py
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import date, datetime
+from typing import Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import (
+    Boolean, Integer, and_, case, column, func, insert, literal, or_, select, union_all, update, values,
+)
 from decimal import Decimal
 
-from db import get_session
+import balances
+import conditional
+import events
+from cache import cached, invalidate, loan_tag, user_tag
+from responses import encoded
+from db import get_read_session, get_session
+from workers import notifications, outbox
 import models, schemas
 
 router = APIRouter(prefix="/loans", tags=["loans"])
-from fastapi import Body
+
+MAX_BATCH = 500
+
+# --- helpers ---
+def _effective_status(loan: models.Loan) -> models.LoanStatus:
+    # Read-side view of what workers/overdue.py will persist on its next sweep.
+    if loan.status == models.LoanStatus.ACTIVE and loan.due_date < datetime.utcnow().date():
+        return models.LoanStatus.OVERDUE
+    return loan.status
+
+def _loan_out(loan: models.Loan) -> schemas.LoanOut:
+    out = schemas.LoanOut.model_validate(loan)
+    status = _effective_status(loan)
+    return out if status == out.status else out.model_copy(update={"status": status})
+
+# Exactly what LoanOut serialises, for list endpoints that skip building ORM entities.
+LOAN_COLUMNS = tuple(getattr(models.Loan, name) for name in schemas.LoanOut.model_fields)
+
+ARCHIVED_LOAN_COLUMNS = tuple(models.loans_archive.c[c.key] for c in LOAN_COLUMNS)
+
+def _loan_row_out(row) -> dict:
+    return {**row._mapping, "status": _effective_status(row)}
+
+def _new_loan_values(payload: schemas.LoanCreate) -> dict:
+    return dict(
+        lender_id=payload.lender_id,
+        borrower_id=payload.borrower_id,
+        amount=payload.amount,
+        currency=payload.currency,
+        due_date=payload.due_date,
+        status=models.LoanStatus.PENDING,
+        created_by_id=payload.created_by_id,
+        # Set initial confirmation based on who created the loan
+        lender_confirmed=False,  # Lender always needs to confirm
+        borrower_confirmed=payload.created_by_id == payload.borrower_id,  # Auto-confirm if borrower creates it
+    )
+
+def _confirm_stmt(loan_id, user_id, confirmed, now: datetime):
+    """
+    Sets the caller's confirmation flag and, when both flags end up true on a PENDING loan,
+    activates it -- all in one UPDATE ... RETURNING, so the flags are computed from the row
+    as the database sees it and two parties confirming at once cannot overwrite each other.
+    Arguments are SQL expressions: bound literals for one loan, VALUES columns for a batch.
+    """
+    loan = models.Loan
+    lender_ok = case((loan.lender_id == user_id, confirmed), else_=loan.lender_confirmed)
+    borrower_ok = case((loan.borrower_id == user_id, confirmed), else_=loan.borrower_confirmed)
+    activates = and_(loan.status == models.LoanStatus.PENDING, lender_ok, borrower_ok)
+    return (
+        update(loan)
+        .where(loan.id == loan_id, or_(loan.lender_id == user_id, loan.borrower_id == user_id))
+        .values(
+            lender_confirmed=lender_ok,
+            borrower_confirmed=borrower_ok,
+            status=case((activates, models.LoanStatus.ACTIVE), else_=loan.status),
+            confirmed_at=case((activates, now), else_=loan.confirmed_at),
+            updated_at=now,
+            version=loan.version + 1,
+        )
+        .returning(loan)
+        .execution_options(synchronize_session=False)
+    )
+
+async def _after_confirm(db: AsyncSession, loans: list[models.Loan], confirmers: dict[int, int], now: datetime) -> None:
+    # Side effects of loans that this statement activated; run before commit.
+    activated = [l for l in loans if l.status == models.LoanStatus.ACTIVE and l.confirmed_at == now]
+    await notifications.schedule_reminders(db, activated)
+    await balances.apply(db, [(None, balances.LoanState.of(l)) for l in activated])
+    for loan in activated:
+        outbox.enqueue(db, loan.id, "LOAN_CONFIRM", confirmed_by=confirmers[loan.id])
+
+def _tags(loans: list[models.Loan], *, with_loan: bool = True) -> set[str]:
+    tags = {user_tag(u) for loan in loans for u in (loan.lender_id, loan.borrower_id)}
+    if with_loan:
+        tags.update(loan_tag(loan.id) for loan in loans)
+    return tags
+
+async def _publish(db: AsyncSession, type: str, loans: list[models.Loan]) -> None:
+    await events.publish(db, *(
+        events.event_for(
+            type, (loan.lender_id, loan.borrower_id),
+            loan_id=loan.id, status=loan.status.value, version=loan.version,
+        )
+        for loan in loans
+    ))
+
+def _item_errors(exc: ValidationError) -> list:
+    return exc.errors(include_url=False, include_context=False)
 
 @router.post("/{loan_id}/confirm", response_model=schemas.LoanOut)
 async def confirm_loan(loan_id: int, body: dict = Body(...), db: AsyncSession = Depends(get_session)):
@@ -17,110 +114,424 @@ async def confirm_loan(loan_id: int, body: dict = Body(...), db: AsyncSession =
     Endpoint to confirm a loan for either lender or borrower.
     Expects: {"user_id": int, "confirmed": bool}
     """
-    loan = await db.get(models.Loan, loan_id)
-    if not loan:
-        raise HTTPException(404, "Loan not found")
     user_id = body.get("user_id")
     confirmed = body.get("confirmed", True)
     if user_id is None:
         raise HTTPException(400, "Missing user_id")
-    # Mark confirmation for lender or borrower
-    if user_id == loan.lender_id:
-        loan.lender_confirmed = confirmed
-    elif user_id == loan.borrower_id:
-        loan.borrower_confirmed = confirmed
-    else:
+    now = datetime.utcnow()
+    loan = (await db.execute(_confirm_stmt(loan_id, user_id, literal(bool(confirmed)), now))).scalar_one_or_none()
+    if loan is None:
+        if await db.get(models.Loan, loan_id) is None:
+            raise HTTPException(404, "Loan not found")
         raise HTTPException(403, "User is not lender or borrower")
-    # If both confirmed, set confirmed_at and status
-    if loan.lender_confirmed and loan.borrower_confirmed:
-        loan.confirmed_at = datetime.utcnow()
-        loan.status = models.LoanStatus.ACTIVE
+    await _after_confirm(db, [loan], {loan.id: user_id}, now)
+    await _publish(db, "loan.updated", [loan])
     await db.commit()
-    await db.refresh(loan)
-    return loan
+    await invalidate(*_tags([loan]))
+    return _loan_out(loan)
 
-# --- helpers ---
-async def _recompute_status(loan: models.Loan) -> None:
-    if loan.status in (models.LoanStatus.CANCELLED, models.LoanStatus.CLOSED):
-        return
-    today = datetime.utcnow().date()
-    if loan.confirmed_at:
-        loan.status = models.LoanStatus.OVERDUE if loan.due_date < today else models.LoanStatus.ACTIVE
-    else:
-        loan.status = models.LoanStatus.PENDING
+@router.post("/confirm/batch")
+async def confirm_loans_batch(items: list[dict] = Body(..., max_length=MAX_BATCH), db: AsyncSession = Depends(get_session)):
+    """
+    Confirms many loans in one UPDATE ... FROM (VALUES ...) RETURNING.
+    Expects: [{"loan_id": int, "user_id": int, "confirmed": bool}, ...]
+    Returns the updated loans and per-item errors, by position in the request.
+    """
+    errors, rows, positions = [], [], {}
+    for i, item in enumerate(items):
+        try:
+            req = schemas.LoanConfirmItem.model_validate(item)
+        except ValidationError as exc:
+            errors.append({"index": i, "detail": _item_errors(exc)})
+            continue
+        if req.loan_id in positions:
+            errors.append({"index": i, "detail": "Duplicate loan_id in batch"})
+            continue
+        positions[req.loan_id] = i
+        rows.append((req.loan_id, req.user_id, req.confirmed))
+
+    loans = []
+    if rows:
+        now = datetime.utcnow()
+        batch = values(
+            column("loan_id", Integer), column("user_id", Integer), column("confirmed", Boolean), name="batch"
+        ).data(rows)
+        if db.bind.dialect.name == "sqlite":
+            batch = batch.cte("batch")  # SQLite takes no column list on a VALUES alias, only on a CTE
+        loans = (await db.execute(_confirm_stmt(batch.c.loan_id, batch.c.user_id, batch.c.confirmed, now))).scalars().all()
+        confirmers = {loan_id: user_id for loan_id, user_id, _ in rows}
+        await _after_confirm(db, loans, confirmers, now)
+        await _publish(db, "loan.updated", loans)
+        await db.commit()
+        await invalidate(*_tags(loans))
+    updated = {loan.id for loan in loans}
+    errors += [
+        {"index": i, "detail": "Loan not found or user is not lender or borrower"}
+        for loan_id, i in positions.items() if loan_id not in updated
+    ]
+    return {
+        "confirmed": [_loan_out(loan) for loan in sorted(loans, key=lambda l: positions[l.id])],
+        "errors": sorted(errors, key=lambda e: e["index"]),
+    }
 
 @router.post("", response_model=schemas.LoanOut, status_code=201)
 async def create_loan(payload: schemas.LoanCreate, db: AsyncSession = Depends(get_session)):
     if payload.lender_id == payload.borrower_id:
         raise HTTPException(400, "Lender and borrower must be different")
 
-    # Determine who created the loan (borrower or lender)
-    is_borrower_creating = payload.created_by_id == payload.borrower_id
-    
-    loan = models.Loan(
-        lender_id=payload.lender_id,
-        borrower_id=payload.borrower_id,
-        amount=payload.amount,
-        currency=payload.currency,
-        due_date=payload.due_date,
-        status=models.LoanStatus.PENDING,
-        created_by_id=payload.created_by_id,
-        # Set initial confirmation based on who created the loan
-        lender_confirmed=False,  # Lender always needs to confirm
-        borrower_confirmed=is_borrower_creating  # Auto-confirm if borrower creates it
-    )
-    db.add(loan)
+    loan = (
+        await db.execute(insert(models.Loan).values(**_new_loan_values(payload)).returning(models.Loan))
+    ).scalar_one()
+    outbox.enqueue(db, loan.id, "LOAN_CREATE", amount=str(loan.amount), currency=loan.currency.value)
+    await _publish(db, "loan.created", [loan])
     await db.commit()
-    await db.refresh(loan)
+    await invalidate(*_tags([loan], with_loan=False))
     return loan
 
-# TODO: These endpoints will be implemented later for advanced features
-# @router.post("/{loan_id}/confirmations")
-# async def propose_action(loan_id: int, body: schemas.ConfirmationCreate, db: AsyncSession = Depends(get_session)):
-#     """
-#     Future endpoint for proposing changes to an active loan (due date changes, repayments)
-#     """
-#     pass
-
-# @router.post("/{loan_id}/confirmations/{conf_id}/act")
-# async def act_on_confirmation(
-#     loan_id: int, conf_id: int, body: schemas.ConfirmationAction, db: AsyncSession = Depends(get_session)
-# ):
-#     """
-#     Future endpoint for accepting/rejecting proposed changes to an active loan
-#     """
-#     pass
+@router.post("/batch")
+async def create_loans_batch(items: list[dict] = Body(..., max_length=MAX_BATCH), db: AsyncSession = Depends(get_session)):
+    """
+    Creates many loans (e.g. a group-expense import) with a single INSERT ... RETURNING.
+    Each item is a `LoanCreate`; invalid items are reported by position and skipped.
+    """
+    errors, valid = [], []
+    for i, item in enumerate(items):
+        try:
+            payload = schemas.LoanCreate.model_validate(item)
+        except ValidationError as exc:
+            errors.append({"index": i, "detail": _item_errors(exc)})
+            continue
+        if payload.lender_id == payload.borrower_id:
+            errors.append({"index": i, "detail": "Lender and borrower must be different"})
+            continue
+        valid.append((i, payload))
 
-@router.get("/{loan_id}", response_model=schemas.LoanOut)
-async def get_loan(loan_id: int, db: AsyncSession = Depends(get_session)):
+    # One lookup for every referenced user, so a bad id fails its item and not the whole INSERT.
+    referenced = {u for _, p in valid for u in (p.lender_id, p.borrower_id, p.created_by_id)}
+    known = set((await db.execute(select(models.User.id).where(models.User.id.in_(referenced)))).scalars())
+    rows = []
+    for i, payload in valid:
+        if {payload.lender_id, payload.borrower_id, payload.created_by_id} <= known:
+            rows.append((i, payload))
+        else:
+            errors.append({"index": i, "detail": "User not found"})
+
+    loans = []
+    if rows:
+        loans = (
+            await db.execute(
+                insert(models.Loan).returning(models.Loan, sort_by_parameter_order=True),
+                [_new_loan_values(payload) for _, payload in rows],
+            )
+        ).scalars().all()
+        for loan in loans:
+            outbox.enqueue(db, loan.id, "LOAN_CREATE", amount=str(loan.amount), currency=loan.currency.value)
+        await _publish(db, "loan.created", loans)
+        await db.commit()
+        await invalidate(*_tags(loans, with_loan=False))
+    return {
+        "created": [schemas.LoanOut.model_validate(loan) for loan in loans],
+        "errors": sorted(errors, key=lambda e: e["index"]),
+    }
+
+def _proposal_payload(body: schemas.ConfirmationCreate, loan: models.Loan) -> dict:
+    """Validates and normalises the payload of a REPAYMENT / DUE_DATE_CHANGE proposal."""
+    try:
+        if body.type == models.EventType.REPAYMENT:
+            amount = Decimal(str(body.payload["amount"]))
+            if not Decimal("0") < amount <= loan.amount - loan.repaid_amount:
+                raise HTTPException(400, "Repayment must be positive and at most the outstanding amount")
+            return {"amount": str(amount)}
+        new_due_date = date.fromisoformat(str(body.payload["new_due_date"]))
+        return {"new_due_date": new_due_date.isoformat(), "previous_due_date": loan.due_date.isoformat()}
+    except (KeyError, ValueError, ArithmeticError):
+        raise HTTPException(400, f"Invalid payload for {body.type.value}")
+
+def _confirmation_event(conf: models.Confirmation, loan: models.Loan) -> events.Event:
+    return events.event_for(
+        "confirmation.updated", (loan.lender_id, loan.borrower_id),
+        loan_id=loan.id, confirmation_id=conf.id, kind=conf.type.value, version=conf.version,
+        finalized=conf.finalized_at is not None,
+    )
+
+async def _apply_confirmation(db: AsyncSession, conf: models.Confirmation) -> Optional[models.Loan]:
+    """
+    Applies a confirmation both parties accepted to its loan with a conditional
+    UPDATE ... WHERE version = ? RETURNING. None means the loan moved underneath us.
+    """
+    loan = models.Loan
+    current = await db.get(loan, conf.loan_id)
+    if current is None:
+        return None
+    before = balances.LoanState.of(current)
+    stmt = (
+        update(loan)
+        .where(loan.id == current.id, loan.version == current.version, loan.status.in_(OUTSTANDING))
+        .returning(loan)
+        .execution_options(synchronize_session=False)
+    )
+    now = datetime.utcnow()
+    if conf.type == models.EventType.REPAYMENT:
+        repaid = loan.repaid_amount + Decimal(conf.payload["amount"])
+        stmt = stmt.where(repaid <= loan.amount).values(
+            repaid_amount=repaid,
+            status=case((repaid >= loan.amount, models.LoanStatus.CLOSED), else_=loan.status),
+        )
+    else:
+        new_due_date = date.fromisoformat(conf.payload["new_due_date"])
+        late = new_due_date < now.date()
+        stmt = stmt.values(
+            due_date=new_due_date, status=models.LoanStatus.OVERDUE if late else models.LoanStatus.ACTIVE,
+        )
+    updated = (
+        await db.execute(stmt.values(updated_at=now, version=loan.version + 1), execution_options={"populate_existing": True})
+    ).scalar_one_or_none()
+    if updated is None:
+        return None
+    await balances.apply(db, [(before, balances.LoanState.of(updated))])
+    if conf.type == models.EventType.DUE_DATE_CHANGE:
+        await notifications.schedule_reminders(db, [updated], date_changed=True)
+    return updated
+
+async def _close_unappliable(db: AsyncSession, conf_id: int) -> Optional[str]:
+    """
+    After _apply_confirmation failed: when the proposal can never apply (the loan is no longer
+    outstanding, or the repayment now exceeds what is owed), finalizes it unapplied and returns
+    why. None when the loan only moved concurrently, so a retry can succeed.
+    """
+    c = models.Confirmation
+    conf = (await db.execute(select(c).where(c.id == conf_id), execution_options={"populate_existing": True})).scalar_one()
+    loan = (
+        await db.execute(select(models.Loan).where(models.Loan.id == conf.loan_id), execution_options={"populate_existing": True})
+    ).scalar_one()
+    if loan.status not in OUTSTANDING:
+        reason = f"Loan is {loan.status.value}"
+    elif conf.type == models.EventType.REPAYMENT and loan.repaid_amount + Decimal(conf.payload["amount"]) > loan.amount:
+        reason = "Repayment exceeds the outstanding amount"
+    else:
+        return None
+    closed = (
+        await db.execute(
+            update(c).where(c.id == conf_id, c.finalized_at.is_(None))
+            .values(finalized_at=datetime.utcnow(), version=c.version + 1)
+            .returning(c),
+            execution_options={"populate_existing": True},
+        )
+    ).scalar_one_or_none()
+    if closed is not None:
+        await events.publish(db, _confirmation_event(closed, loan))
+        await db.commit()
+    return reason
+
+@router.post("/{loan_id}/confirmations", response_model=schemas.ConfirmationOut, status_code=201)
+async def propose_action(loan_id: int, body: schemas.ConfirmationCreate, db: AsyncSession = Depends(get_session)):
+    """
+    Proposes a change to an active loan (REPAYMENT or DUE_DATE_CHANGE). The proposer's side
+    is accepted right away; the counterparty accepts or rejects through /act.
+    """
     loan = await db.get(models.Loan, loan_id)
     if not loan:
         raise HTTPException(404, "Loan not found")
-    await _recompute_status(loan)
+    if body.requested_by_id not in (loan.lender_id, loan.borrower_id):
+        raise HTTPException(403, "User is not lender or borrower")
+    if body.type == models.EventType.LOAN_CREATE:
+        raise HTTPException(400, "Use /loans/{loan_id}/confirm for the initial confirmation")
+    if loan.status not in OUTSTANDING:
+        raise HTTPException(409, "Loan is not active")
+
+    conf = (
+        await db.execute(
+            insert(models.Confirmation).values(
+                loan_id=loan_id,
+                type=body.type,
+                payload=_proposal_payload(body, loan),
+                requested_by_id=body.requested_by_id,
+                lender_accepted=body.requested_by_id == loan.lender_id,
+                borrower_accepted=body.requested_by_id == loan.borrower_id,
+            ).returning(models.Confirmation)
+        )
+    ).scalar_one()
+    await events.publish(db, _confirmation_event(conf, loan))
     await db.commit()
-    await db.refresh(loan)
-    return loan
+    return conf
 
-@router.get("/dashboard/{user_id}")
-async def dashboard(user_id: int, db: AsyncSession = Depends(get_session)):
+@router.post("/{loan_id}/confirmations/{conf_id}/act", response_model=schemas.ConfirmationOut)
+async def act_on_confirmation(
+    loan_id: int, conf_id: int, body: schemas.ConfirmationAction, db: AsyncSession = Depends(get_session)
+):
     """
-    Returns the two blocks specified by the CDC:
-     - 'Mes prêts en cours' (ACTIVE, OVERDUE) => orange
-     - 'Historique clos' (CLOSED) => green
+    Accepts or rejects a pending proposal without row locks: the flag is written with one
+    UPDATE ... WHERE version = ? RETURNING, and 409 tells the client to reload and retry.
+    When this makes both sides accept, the change is applied to the loan in the same
+    transaction (itself version-checked), or nothing is. A proposal the loan can no longer
+    take (closed meanwhile, or overpaying it) is finalized unapplied and 409 says why.
     """
-    q_active = await db.execute(
-        select(models.Loan).where(
-            ((models.Loan.lender_id == user_id) | (models.Loan.borrower_id == user_id)) &
-            (models.Loan.status.in_([models.LoanStatus.PENDING, models.LoanStatus.ACTIVE]))
-        )
+    conf = await db.get(models.Confirmation, conf_id)
+    if not conf or conf.loan_id != loan_id:
+        raise HTTPException(404, "Confirmation not found")
+    loan = await db.get(models.Loan, loan_id)
+    if body.user_id not in (loan.lender_id, loan.borrower_id):
+        raise HTTPException(403, "User is not lender or borrower")
+    if conf.finalized_at is not None:
+        raise HTTPException(409, "Confirmation already finalized")
+    expected = conf.version if body.version is None else body.version
+
+    c = models.Confirmation
+    mine, theirs = (
+        (c.lender_accepted, c.borrower_accepted) if body.user_id == loan.lender_id
+        else (c.borrower_accepted, c.lender_accepted)
     )
-    q_closed = await db.execute(
-        select(models.Loan).where(
-            ((models.Loan.lender_id == user_id) | (models.Loan.borrower_id == user_id)) &
-            (models.Loan.status == models.LoanStatus.CLOSED)
+    now = datetime.utcnow()
+    finalized_at = case((theirs, now), else_=None) if body.accept else now
+    conf = (
+        await db.execute(
+            update(c)
+            .where(c.id == conf_id, c.version == expected, c.finalized_at.is_(None))
+            .values({mine: body.accept, c.finalized_at: finalized_at, c.version: c.version + 1})
+            .returning(c),
+            execution_options={"populate_existing": True},
         )
+    ).scalar_one_or_none()
+    if conf is None:
+        raise HTTPException(409, "Confirmation was modified concurrently; reload and retry")
+
+    if conf.finalized_at is not None and conf.lender_accepted and conf.borrower_accepted:
+        loan = await _apply_confirmation(db, conf)
+        if loan is None:
+            await db.rollback()
+            reason = await _close_unappliable(db, conf_id)
+            if reason is None:
+                raise HTTPException(409, "Loan was modified concurrently; reload and retry")
+            raise HTTPException(409, f"{reason}; the proposal was closed without being applied")
+        outbox.enqueue(db, loan.id, conf.type.value, event_id=conf.id, **conf.payload)
+        await events.publish(db, _confirmation_event(conf, loan))
+        await _publish(db, "loan.updated", [loan])
+        await db.commit()
+        await invalidate(*_tags([loan]))
+        return conf
+    await events.publish(db, _confirmation_event(conf, loan))
+    await db.commit()
+    return conf
+
+async def _loan_validator(loan_id: int, db: AsyncSession, **_) -> Optional[conditional.Validator]:
+    archived = models.loans_archive.c
+    row = (
+        await db.execute(union_all(
+            select(models.Loan.version, models.Loan.updated_at).where(models.Loan.id == loan_id),
+            select(archived.version, archived.updated_at).where(archived.id == loan_id),
+        ))
+    ).first()
+    if row is None:
+        return None
+    return conditional.validator(
+        "loan", loan_id, row.version, datetime.utcnow().date(),
+        last_modified=conditional.status_day_start(row.updated_at),
     )
-    return {
-        "in_progress": [schemas.LoanOut.model_validate(row) for row in q_active.scalars().all()],
-        "closed": [schemas.LoanOut.model_validate(row) for row in q_closed.scalars().all()],
-    }
+
+@router.get("/{loan_id}", response_model=schemas.LoanOut)
+@cached(
+    key=lambda loan_id, **_: f"loan:{loan_id}",
+    tags=lambda loan_id, **_: [loan_tag(loan_id)],
+    validator=_loan_validator,
+)
+async def get_loan(loan_id: int, db: AsyncSession = Depends(get_read_session)):
+    loan = await db.get(models.Loan, loan_id)
+    if loan:
+        return _loan_out(loan)
+    archived = (
+        await db.execute(select(*ARCHIVED_LOAN_COLUMNS).where(models.loans_archive.c.id == loan_id))
+    ).first()
+    if not archived:
+        raise HTTPException(404, "Loan not found")
+    return schemas.LoanOut.model_validate(archived, from_attributes=True)
+
+IN_PROGRESS = (models.LoanStatus.PENDING, models.LoanStatus.ACTIVE, models.LoanStatus.OVERDUE)
+OUTSTANDING = (models.LoanStatus.ACTIVE, models.LoanStatus.OVERDUE)
+
+def _by_party(user_id: int, *criteria, columns=(models.Loan.id,)):
+    """
+    One SELECT per side of the loan glued with UNION ALL instead of `lender_id = X OR borrower_id = X`,
+    so each branch is served by its own (party, status, id) index. Lender and borrower are always
+    different users, so the branches never overlap.
+    """
+    return [
+        select(*columns).where(party == user_id, *criteria)
+        for party in (models.Loan.lender_id, models.Loan.borrower_id)
+    ]
+
+def _closed_page(user_id: int, limit: int, before: Optional[int]):
+    """
+    Keyset page over CLOSED loans, newest first, across `loans` and `loans_archive` (where
+    workers/archive.py moves them); one extra row tells us whether a next page exists.
+    """
+    branches = []
+    for table in (models.Loan.__table__, models.loans_archive):
+        for party in (table.c.lender_id, table.c.borrower_id):
+            q = select(table.c.id).where(party == user_id, table.c.status == models.LoanStatus.CLOSED)
+            if before is not None:
+                q = q.where(table.c.id < before)
+            branches.append(select(q.order_by(table.c.id.desc()).limit(limit + 1).subquery().c.id))
+    page = union_all(*branches).subquery()
+    return select(page.c.id).order_by(page.c.id.desc()).limit(limit + 1).subquery()
+
+async def _dashboard_validator(user_id: int, closed_limit: int, closed_before: Optional[int], db: AsyncSession, **_):
+    # Every loan write bumps its version and updated_at, and every new loan has a higher id, so
+    # (count, sum of versions, latest updated_at, highest id) moves with any change to the user's
+    # loans -- and with it the balances, which only move with them. Count and version sum alone
+    # can cancel out (archiving a v3 loan while creating one and confirming two). Archived loans
+    # never change; moving one to the archive changes the count, which only costs a refetch.
+    sides = union_all(*_by_party(user_id, columns=(
+        func.count().label("n"), func.sum(models.Loan.version).label("versions"),
+        func.max(models.Loan.updated_at).label("updated_at"), func.max(models.Loan.id).label("max_id"),
+    ))).subquery()
+    n, versions, updated_at, max_id = (
+        await db.execute(select(
+            func.sum(sides.c.n), func.sum(sides.c.versions), func.max(sides.c.updated_at), func.max(sides.c.max_id),
+        ))
+    ).one()
+    return conditional.validator(
+        "dashboard", user_id, closed_limit, closed_before, int(n or 0), int(versions or 0),
+        updated_at, max_id, datetime.utcnow().date(),
+        last_modified=conditional.status_day_start(updated_at),
+    )
+
+@router.get("/dashboard/{user_id}", response_model=schemas.DashboardOut)
+@cached(
+    key=lambda user_id, closed_limit, closed_before, **_: f"dashboard:{user_id}:{closed_limit}:{closed_before}",
+    tags=lambda user_id, **_: [user_tag(user_id)],
+    validator=_dashboard_validator,
+)
+async def dashboard(
+    user_id: int,
+    closed_limit: int = Query(50, ge=1, le=200),
+    closed_before: Optional[int] = Query(None, description="Cursor: `next_cursor` of the previous page"),
+    db: AsyncSession = Depends(get_read_session),
+):
+    """
+    Returns the two blocks specified by the CDC:
+     - 'Mes prêts en cours' (PENDING, ACTIVE, OVERDUE) => orange
+     - 'Historique clos' (CLOSED) => green, paginated by `closed_before` / `next_cursor`
+    plus per-currency totals of what is still outstanding (from user_balances).
+    Both blocks come back from a single query (closed history may come from loans_archive),
+    as plain column rows encoded in one pass.
+    """
+    closed_ids = _closed_page(user_id, closed_limit, closed_before)
+    ids = union_all(*_by_party(user_id, models.Loan.status.in_(IN_PROGRESS)), select(closed_ids.c.id))
+    loans = union_all(
+        select(*LOAN_COLUMNS).where(models.Loan.id.in_(ids)),
+        select(*ARCHIVED_LOAN_COLUMNS).where(models.loans_archive.c.id.in_(select(closed_ids.c.id))),
+    ).subquery()
+    rows = (await db.execute(select(loans).order_by(loans.c.id.desc()))).all()
+
+    in_progress = [_loan_row_out(r) for r in rows if r.status != models.LoanStatus.CLOSED]
+    closed = [_loan_row_out(r) for r in rows if r.status == models.LoanStatus.CLOSED]
+    next_cursor = None
+    if len(closed) > closed_limit:
+        closed = closed[:closed_limit]
+        next_cursor = closed[-1]["id"]
+    return encoded(schemas.DashboardOut, {
+        "in_progress": in_progress,
+        "closed": closed,
+        "next_cursor": next_cursor,
+        "totals": await balances.for_user(db, user_id),
+    })
@@ -0,0 +1,69 @@
+# app/routers/metrics.py
+from dataclasses import asdict
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import admission
+import cache
+import events
+import profiling
+from db import get_session, pool_stats, pool_wait, replica_stats
+from metrics import PrometheusWriter
+from workers import outbox
+
+router = APIRouter(tags=["internal"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(db: AsyncSession = Depends(get_session)):
+    """Prometheus text exposition of request, admission, pool, cache, outbox and change-feed metrics."""
+    w = PrometheusWriter()
+    routes = [({"method": m, "route": r}, stats) for (m, r), stats in sorted(profiling.routes.items())]
+
+    w.histogram("http_request_duration_seconds", "Request latency by route.",
+                [(labels, stats.latency) for labels, stats in routes])
+    w.metric("http_requests_total", "counter", "Requests by route and status code.",
+             [({**labels, "status": code}, n) for labels, stats in routes for code, n in sorted(stats.statuses.items())])
+    w.histogram("http_request_db_queries", "SQL statements issued per request.",
+                [(labels, stats.queries) for labels, stats in routes])
+    w.metric("http_request_db_seconds_total", "counter", "Time spent in SQL statements by route.",
+             [(labels, stats.db_seconds) for labels, stats in routes])
+    w.metric("http_request_n_plus_one_total", "counter",
+             f"Requests issuing at least {profiling.N_PLUS_ONE_THRESHOLD} SQL statements.",
+             [(labels, stats.n_plus_one) for labels, stats in routes])
+
+    w.metric("admission_admitted_total", "counter", "Requests let through admission control.",
+             [({}, admission.stats.admitted)])
+    w.metric("admission_shed_total", "counter", "Requests rejected by admission control, by route and reason.",
+             [({"route": route, "reason": reason}, n) for (route, reason), n in sorted(admission.stats.shed.items())])
+    w.metric("admission_in_flight", "gauge", "Requests currently counted against the in-flight cap.",
+             [({}, admission.stats.in_flight)])
+
+    pool = pool_stats()
+    for gauge in ("size", "checked_out", "checked_in", "overflow"):
+        w.metric(f"db_pool_{gauge}", "gauge", f"Connection pool {gauge.replace('_', ' ')}.", [({}, pool[gauge])])
+    w.histogram("db_pool_wait_seconds", "Time spent waiting for a pooled connection.", [({}, pool_wait)])
+    replica = replica_stats()
+    if replica["configured"]:
+        w.metric("db_replica_healthy", "gauge", "1 while read routes may use the replica.", [({}, int(replica["healthy"]))])
+        if replica["lag_seconds"] is not None:
+            w.metric("db_replica_lag_seconds", "gauge", "Replication lag at the last health check.",
+                     [({}, replica["lag_seconds"])])
+        w.metric("db_read_sessions_total", "counter", "Read-only sessions by where they were routed.",
+                 [({"route_to": reason}, n) for reason, n in sorted(replica["reads"].items())])
+
+    for name, value in asdict(cache.backend.stats).items():
+        w.metric(f"cache_{name}_total", "counter", f"Response cache {name.replace('_', ' ')}.", [({}, value)])
+
+    lag = await outbox.pending_lag(db)
+    w.metric("hedera_outbox_submitted_total", "counter", "Outbox entries submitted to the ledger.",
+             [({}, outbox.stats.submitted)])
+    w.metric("hedera_outbox_failed_total", "counter", "Failed ledger submissions.", [({}, outbox.stats.failed)])
+    w.metric("hedera_outbox_pending", "gauge", "Outbox entries not yet submitted.", [({}, lag["pending"])])
+    w.metric("hedera_outbox_lag_seconds", "gauge", "Age of the oldest unsubmitted outbox entry.",
+             [({}, lag["oldest_pending_seconds"])])
+    w.metric("events_connections", "gauge", "Open change-feed streams.", [({}, events.bus.connections)])
+    w.metric("events_dispatched_total", "counter", "Change-feed events dispatched.", [({}, events.bus.dispatched)])
+    w.metric("events_dropped_connections_total", "counter", "Change-feed streams dropped for falling behind.",
+             [({}, events.bus.dropped)])
+    return PlainTextResponse(w.render(), media_type="text/plain; version=0.0.4")
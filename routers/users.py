@@ -1,12 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, EmailStr
+from datetime import datetime
+from typing import Annotated, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel, EmailStr, Field, StringConstraints
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
-from models import User, UserFriend
-from db import get_session
+from sqlalchemy import any_, case, delete, func, literal, or_, select, union_all, update
+from models import User, UserBalance, UserFriend
+import balances
+import conditional
+import events
+import schemas
+from cache import cached, invalidate, user_tag
+from responses import encoded
+from db import get_read_session, get_session
+from friend_graph import graph
 
 router = APIRouter()
 
+MAX_CONTACTS = 5000
+Sha256Hex = Annotated[str, StringConstraints(pattern=r"^[0-9a-fA-F]{64}$")]
+
 class UserCreate(BaseModel):
     email: EmailStr
 
@@ -16,20 +30,63 @@ class FriendAttach(BaseModel):
 class FriendAttachEmail(BaseModel):
     email: EmailStr
 
-@router.get("/users/{user_id}", status_code=200)
-async def get_user_profile(user_id: int, session: AsyncSession = Depends(get_session)):
-    user = await session.get(User, user_id)
+class ContactMatch(BaseModel):
+    # Lowercase hex SHA-256 of normalised emails / phone numbers (contacts.py)
+    email_hashes: list[Sha256Hex] = Field(default_factory=list, max_length=MAX_CONTACTS)
+    phone_hashes: list[Sha256Hex] = Field(default_factory=list, max_length=MAX_CONTACTS)
+    attach: bool = False
+
+def _pair(a: int, b: int) -> tuple[int, int]:
+    """Canonical (min, max) ordering under which a friendship is stored."""
+    return (a, b) if a < b else (b, a)
+
+def _touch(*user_ids: int):
+    """Bumps users.updated_at; friendship changes count as a change to both users."""
+    return update(User).where(User.id.in_(set(user_ids))).values(updated_at=datetime.utcnow())
+
+async def _befriend(session: AsyncSession, user_id: int, friend_id: int) -> UserFriend:
+    # The unique pair index does the duplicate check; no read-before-write.
+    low, high = _pair(user_id, friend_id)
+    friendship = UserFriend(user_id=low, friend_id=high)
+    session.add(friendship)
+    try:
+        await session.execute(_touch(low, high))
+        await events.publish(session, events.event_for("friend.added", (low, high), user_ids=[low, high]))
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail="Already friends")
+    graph.invalidate(user_id, friend_id)
+    await invalidate(user_tag(user_id), user_tag(friend_id))
+    return friendship
+
+async def _profile_validator(user_id: int, session: AsyncSession, **_):
+    balances_changed = (
+        select(func.max(UserBalance.updated_at)).where(UserBalance.user_id == user_id).scalar_subquery()
+    )
+    row = (await session.execute(select(User.updated_at, balances_changed).where(User.id == user_id))).first()
+    if row is None:
+        return None
+    # balances.for_user counts unswept past-due loans as overdue, so the body also moves at midnight
+    last_modified = max((t for t in row if t is not None), default=None)
+    return conditional.validator(
+        "profile", user_id, *row, datetime.utcnow().date(),
+        last_modified=conditional.status_day_start(last_modified),
+    )
+
+PROFILE_COLUMNS = tuple(getattr(User, name) for name in schemas.UserProfileOut.model_fields if name != "balances")
+
+@router.get("/users/{user_id}", status_code=200, response_model=schemas.UserProfileOut)
+@cached(
+    key=lambda user_id, **_: f"profile:{user_id}",
+    tags=lambda user_id, **_: [user_tag(user_id)],
+    validator=_profile_validator,
+)
+async def get_user_profile(user_id: int, session: AsyncSession = Depends(get_read_session)):
+    user = (await session.execute(select(*PROFILE_COLUMNS).where(User.id == user_id))).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return {
-        "id": user.id,
-        "email": user.email,
-        "phone": user.phone,
-        "pseudonym": user.pseudonym,
-        "photo_url": user.photo_url,
-        "is_2fa_enabled": user.is_2fa_enabled,
-        "created_at": user.created_at,
-    }
+    return encoded(schemas.UserProfileOut, {**user._mapping, "balances": await balances.for_user(session, user_id)})
 
 @router.post("/users", status_code=201)
 async def create_or_login_user(user: UserCreate, session: AsyncSession = Depends(get_session)):
@@ -41,44 +98,66 @@ async def create_or_login_user(user: UserCreate, session: AsyncSession = Depends
     session.add(new_user)
     await session.commit()
     await session.refresh(new_user)
+    await invalidate(user_tag(new_user.id))
     return {"id": new_user.id, "email": new_user.email}
 
 @router.post("/users/{user_id}/friends", status_code=201)
 async def add_friend(user_id: int, body: FriendAttach, session: AsyncSession = Depends(get_session)):
-    user = await session.get(User, user_id)
-    friend = await session.get(User, body.friend_id)
-    if not user or not friend:
+    if body.friend_id == user_id:
+        raise HTTPException(status_code=400, detail="You cannot add yourself")
+    found = await session.execute(select(User.id).where(User.id.in_([user_id, body.friend_id])))
+    if len(found.all()) != 2:
         raise HTTPException(status_code=404, detail="User or friend not found")
 
-    # Prevent duplicates (both directions)
-    result = await session.execute(
-        select(UserFriend).where(
-            or_(
-                (UserFriend.user_id == user_id) & (UserFriend.friend_id == body.friend_id),
-                (UserFriend.user_id == body.friend_id) & (UserFriend.friend_id == user_id),
-            )
-        )
-    )
-    existing = result.scalar_one_or_none()
-    if existing:
-        raise HTTPException(status_code=400, detail="Already friends")
-
-    friendship = UserFriend(user_id=user_id, friend_id=body.friend_id)
-    session.add(friendship)
-    await session.commit()
-    await session.refresh(friendship)
+    friendship = await _befriend(session, user_id, body.friend_id)
     return {"friendship_id": friendship.id, "user_id": user_id, "friend_id": body.friend_id}
 
-@router.get("/users/{user_id}/friends", status_code=200)
-async def get_friends(user_id: int, session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(UserFriend).where(UserFriend.user_id == user_id))
-    friendships = result.scalars().all()
-    friends = []
-    for f in friendships:
-        friend = await session.get(User, f.friend_id)
-        if friend:
-            friends.append({"id": friend.id, "email": friend.email})
-    return {"user_id": user_id, "friends": friends}
+async def _friends_validator(user_id: int, cursor: Optional[int], limit: int, session: AsyncSession, **_):
+    # Adding or removing a friendship touches both users (see _touch), and a listed friend is
+    # only (id, email), which never changes, so the user's own row is enough.
+    updated_at = (await session.execute(select(User.updated_at).where(User.id == user_id))).scalar_one_or_none()
+    return conditional.validator("friends", user_id, updated_at, cursor, limit, last_modified=updated_at)
+
+@router.get("/users/{user_id}/friends", status_code=200, response_model=schemas.FriendsPage)
+@cached(
+    key=lambda user_id, cursor, limit, **_: f"friends:{user_id}:{cursor}:{limit}",
+    tags=lambda user_id, **_: [user_tag(user_id)],
+    validator=_friends_validator,
+)
+async def get_friends(
+    user_id: int,
+    cursor: Optional[int] = Query(None, description="Cursor: `next_cursor` of the previous page"),
+    limit: int = Query(200, ge=1, le=1000),
+    session: AsyncSession = Depends(get_read_session),
+):
+    friend_ids = union_all(
+        select(UserFriend.friend_id.label("id")).where(UserFriend.user_id == user_id),
+        select(UserFriend.user_id.label("id")).where(UserFriend.friend_id == user_id),
+    ).subquery()
+    q = select(User.id, User.email).join(friend_ids, friend_ids.c.id == User.id)
+    if cursor is not None:
+        q = q.where(User.id > cursor)
+    rows = (await session.execute(q.order_by(User.id).limit(limit + 1))).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return encoded(schemas.FriendsPage, {"user_id": user_id, "friends": rows[:limit], "next_cursor": next_cursor})
+
+@router.get("/users/{user_id}/friends/mutual/{other_id}", status_code=200)
+async def get_mutual_friends(user_id: int, other_id: int, session: AsyncSession = Depends(get_session)):
+    mutual = await graph.mutual(session, user_id, other_id)
+    result = await session.execute(select(User.id, User.email).where(User.id.in_(mutual)).order_by(User.id))
+    return {"user_id": user_id, "other_id": other_id, "mutual": [{"id": r.id, "email": r.email} for r in result]}
+
+@router.get("/users/{user_id}/friends/suggestions", status_code=200)
+async def get_friend_suggestions(
+    user_id: int, limit: int = Query(20, ge=1, le=100), session: AsyncSession = Depends(get_session)
+):
+    ranked = await graph.suggestions(session, user_id, limit)
+    result = await session.execute(select(User.id, User.email).where(User.id.in_([uid for uid, _ in ranked])))
+    emails = {r.id: r.email for r in result}
+    suggestions = [
+        {"id": uid, "email": emails[uid], "mutual_count": count} for uid, count in ranked if uid in emails
+    ]
+    return {"user_id": user_id, "suggestions": suggestions}
 
 @router.post("/users/{user_id}/friends/email", status_code=201)
 async def add_friend_by_email(user_id: int, body: FriendAttachEmail, session: AsyncSession = Depends(get_session)):
@@ -96,52 +175,98 @@ async def add_friend_by_email(user_id: int, body: FriendAttachEmail, session: As
     if friend.id == user_id:
         raise HTTPException(status_code=400, detail="You cannot add yourself")
 
-    # Prevent duplicates (both directions)
-    result = await session.execute(
-        select(UserFriend).where(
-            or_(
-                (UserFriend.user_id == user_id) & (UserFriend.friend_id == friend.id),
-                (UserFriend.user_id == friend.id) & (UserFriend.friend_id == user_id),
+    friendship = await _befriend(session, user_id, friend.id)
+    return {"friendship_id": friendship.id, "user_id": user_id, "friend": {"id": friend.id, "email": friend.email}}
+
+def _hash_in(column, hashes: list[str], dialect: str):
+    # One array parameter on Postgres instead of one bind per hash.
+    if dialect == "postgresql":
+        return column == any_(literal(hashes, postgresql.ARRAY(column.type)))
+    return column.in_(hashes)
+
+@router.post("/users/{user_id}/contacts/match", status_code=200)
+async def match_contacts(user_id: int, body: ContactMatch, session: AsyncSession = Depends(get_session)):
+    """
+    Resolves a whole address book (hashed emails / phones) to users in one query, flagging
+    those already friends through a LEFT JOIN on the canonical pair. With `attach`, every
+    match not yet a friend is added with a single INSERT ... ON CONFLICT DO NOTHING.
+    """
+    if await session.get(User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    email_hashes = {h.lower() for h in body.email_hashes}
+    phone_hashes = {h.lower() for h in body.phone_hashes}
+    if not email_hashes and not phone_hashes:
+        return {"user_id": user_id, "matches": [], "attached": 0}
+
+    dialect = session.bind.dialect.name
+    low = case((User.id < user_id, User.id), else_=literal(user_id))
+    high = case((User.id < user_id, literal(user_id)), else_=User.id)
+    rows = (
+        await session.execute(
+            select(User.id, User.pseudonym, User.photo_url, User.email_sha256, User.phone_sha256,
+                   UserFriend.id.is_not(None).label("is_friend"))
+            .outerjoin(UserFriend, (UserFriend.user_id == low) & (UserFriend.friend_id == high))
+            .where(
+                or_(
+                    _hash_in(User.email_sha256, sorted(email_hashes), dialect),
+                    _hash_in(User.phone_sha256, sorted(phone_hashes), dialect),
+                ),
+                User.id != user_id,
             )
+            .order_by(User.id)
         )
-    )
-    existing = result.scalar_one_or_none()
-    if existing:
-        raise HTTPException(status_code=400, detail="Already friends")
+    ).all()
 
-    friendship = UserFriend(user_id=user_id, friend_id=friend.id)
-    session.add(friendship)
-    await session.commit()
-    await session.refresh(friendship)
+    attached = []
+    if body.attach:
+        new = [r.id for r in rows if not r.is_friend]
+        if new:
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            pairs = [_pair(user_id, friend_id) for friend_id in new]
+            attached = (
+                await session.execute(
+                    insert(UserFriend)
+                    .values([{"user_id": a, "friend_id": b} for a, b in pairs])
+                    .on_conflict_do_nothing(index_elements=["user_id", "friend_id"])
+                    .returning(UserFriend.user_id, UserFriend.friend_id)
+                )
+            ).all()
+            if attached:
+                await session.execute(_touch(user_id, *(u for pair in attached for u in pair)))
+            await events.publish(session, *(
+                events.event_for("friend.added", pair, user_ids=list(pair)) for pair in attached
+            ))
+            await session.commit()
+            graph.invalidate(user_id, *(u for pair in attached for u in pair))
+            await invalidate(*{user_tag(u) for pair in attached for u in pair})
 
-    return {"friendship_id": friendship.id, "user_id": user_id, "friend": {"id": friend.id, "email": friend.email}}
+    friends_now = {a if b == user_id else b for a, b in attached}
+    matches = [
+        {
+            "id": r.id,
+            "pseudonym": r.pseudonym,
+            "photo_url": r.photo_url,
+            "email_sha256": r.email_sha256 if r.email_sha256 in email_hashes else None,
+            "phone_sha256": r.phone_sha256 if r.phone_sha256 in phone_hashes else None,
+            "is_friend": r.is_friend or r.id in friends_now,
+        }
+        for r in rows
+    ]
+    return {"user_id": user_id, "matches": matches, "attached": len(attached)}
 
 @router.delete("/users/{user_id}/friends/{friend_id}", status_code=200)
 async def delete_friend(user_id: int, friend_id: int, session: AsyncSession = Depends(get_session)):
     """Delete a friendship between two users"""
-    # First, verify both users exist
-    user = await session.get(User, user_id)
-    friend = await session.get(User, friend_id)
-    
-    if not user or not friend:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # Find the friendship record
+    low, high = _pair(user_id, friend_id)
     result = await session.execute(
-        select(UserFriend).where(
-            or_(
-                (UserFriend.user_id == user_id) & (UserFriend.friend_id == friend_id),
-                (UserFriend.user_id == friend_id) & (UserFriend.friend_id == user_id),
-            )
-        )
+        delete(UserFriend).where(UserFriend.user_id == low, UserFriend.friend_id == high)
     )
-    friendship = result.scalar_one_or_none()
-    
-    if not friendship:
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Friendship not found")
-
-    # Delete the friendship
-    await session.delete(friendship)
+    await session.execute(_touch(low, high))
+    await events.publish(session, events.event_for("friend.removed", (low, high), user_ids=[low, high]))
     await session.commit()
+    graph.invalidate(user_id, friend_id)
+    await invalidate(user_tag(user_id), user_tag(friend_id))
 
-    return {"message": "Friendship deleted successfully"}
\ No newline at end of file
+    return {"message": "Friendship deleted successfully"}
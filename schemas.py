@@ -1,7 +1,7 @@
 # app/schemas.py
 from datetime import date, datetime
 from decimal import Decimal
-from typing import Optional, Literal
+from typing import Optional
 
 from pydantic import BaseModel, Field, EmailStr
 
@@ -23,6 +23,34 @@ class UserOut(BaseModel):
     class Config:
         from_attributes = True
 
+class FriendOut(BaseModel):
+    id: int
+    email: str
+
+class FriendsPage(BaseModel):
+    user_id: int
+    friends: list[FriendOut]
+    next_cursor: Optional[int]
+
+class BalanceOut(BaseModel):
+    currency: Currency
+    lent_outstanding: Decimal
+    borrowed_outstanding: Decimal
+    overdue_amount: Decimal
+    lent_count: int
+    borrowed_count: int
+    overdue_count: int
+
+class UserProfileOut(BaseModel):
+    id: int
+    email: str
+    phone: Optional[str]
+    pseudonym: Optional[str]
+    photo_url: Optional[str]
+    is_2fa_enabled: Optional[bool]
+    created_at: datetime
+    balances: list[BalanceOut]
+
 # ===== Loans =====
 class LoanCreate(BaseModel):
     lender_id: int
@@ -32,6 +60,11 @@ class LoanCreate(BaseModel):
     due_date: date
     created_by_id: int = Field(description="ID of the user creating the loan (either lender or borrower)")
 
+class LoanConfirmItem(BaseModel):
+    loan_id: int
+    user_id: int
+    confirmed: bool = True
+
 class LoanOut(BaseModel):
     id: int
     lender_id: int
@@ -45,9 +78,17 @@ class LoanOut(BaseModel):
     confirmed_at: Optional[datetime]
     created_by_id: int
     created_at: datetime
+    repaid_amount: Decimal = Decimal("0")
+    version: int = 1
     class Config:
         from_attributes = True
 
+class DashboardOut(BaseModel):
+    in_progress: list[LoanOut]
+    closed: list[LoanOut]
+    next_cursor: Optional[int]
+    totals: list[BalanceOut]
+
 # ===== Confirmations =====
 class ConfirmationCreate(BaseModel):
     type: EventType
@@ -65,9 +106,23 @@ class ConfirmationOut(BaseModel):
     borrower_accepted: bool
     finalized_at: Optional[datetime]
     created_at: datetime
+    version: int
+    class Config:
+        from_attributes = True
+
+class HederaLogOut(BaseModel):
+    id: int
+    loan_id: int
+    event_id: Optional[int]
+    direction: str
+    tx_id: Optional[str]
+    meta: dict
+    created_at: datetime
     class Config:
         from_attributes = True
 
 class ConfirmationAction(BaseModel):
     accept: bool  # True to accept, False to reject/cancel
-    actor_role: Literal["LENDER", "BORROWER"]
+    user_id: int  # the acting party; their side (lender or borrower) is looked up on the loan
+    # Version the client acted on; a stale value is answered with 409 instead of being applied
+    version: Optional[int] = None
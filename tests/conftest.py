@@ -0,0 +1,90 @@
+# app/tests/conftest.py
+"""
+Tests run the app in-process against a throwaway SQLite file by default; set
+TEST_DATABASE_URL to a scratch Postgres database to run them there (its tables are dropped).
+"""
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+# db.py and friends read their settings at import time
+_tmp = tempfile.mkdtemp(prefix="loanapp-tests-")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite+aiosqlite:///{_tmp}/test.db")
+os.environ["DATABASE_REPLICA_URL"] = ""
+os.environ["CACHE_ENABLED"] = "0"
+os.environ["ADMISSION_ENABLED"] = "0"
+os.environ["EVENTS_PG_FANOUT"] = "0"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+import pytest
+from sqlalchemy import MetaData
+
+import cache
+from db import Base, SessionLocal, engine
+from friend_graph import graph
+from main import app
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def cache_on(monkeypatch):
+    """The response cache enabled (the suite runs with it off), on an empty backend of its own."""
+    backend = cache.LRUBackend()
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(cache, "backend", backend)
+    return backend
+
+@pytest.fixture
+async def fresh_db():
+    """An empty database: every table dropped, nothing created."""
+    async with engine.begin() as conn:
+        reflected = MetaData()
+        await conn.run_sync(reflected.reflect)
+        await conn.run_sync(reflected.drop_all)
+        if conn.dialect.name == "postgresql":
+            for enum in ("loanstatus", "eventtype", "currency"):
+                await conn.exec_driver_sql(f"DROP TYPE IF EXISTS {enum}")
+    graph.clear()
+    yield engine
+    await engine.dispose()  # pooled asyncpg connections belong to this test's event loop
+
+@pytest.fixture
+async def db(fresh_db):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+
+@pytest.fixture
+async def session(db):
+    async with SessionLocal() as session:
+        yield session
+
+@pytest.fixture
+async def client(db):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+async def create_users(client, n: int) -> list[int]:
+    return [(await client.post("/users", json={"email": f"user{i}@example.com"})).json()["id"] for i in range(n)]
+
+async def active_loan(client, lender_id: int, borrower_id: int, amount: str = "100.00", due_in_days: int = 30) -> dict:
+    """A loan created by the borrower and confirmed by the lender."""
+    loan = (await client.post("/loans", json={
+        "lender_id": lender_id, "borrower_id": borrower_id, "amount": amount,
+        "due_date": str(date.today() + timedelta(days=due_in_days)), "created_by_id": borrower_id,
+    })).json()
+    r = await client.post(f"/loans/{loan['id']}/confirm", json={"user_id": lender_id})
+    assert r.status_code == 200 and r.json()["status"] == ("OVERDUE" if due_in_days < 0 else "ACTIVE"), r.text
+    return r.json()
+
+async def propose_repayment(client, loan: dict, amount: str) -> dict:
+    r = await client.post(f"/loans/{loan['id']}/confirmations", json={
+        "type": "REPAYMENT", "payload": {"amount": amount}, "requested_by_id": loan["borrower_id"],
+    })
+    assert r.status_code == 201, r.text
+    return r.json()
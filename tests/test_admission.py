@@ -0,0 +1,44 @@
+# app/tests/test_admission.py
+import httpx
+import pytest
+
+import admission
+from admission import AdmissionMiddleware, LocalBucketStore
+from main import app
+from routers import loans, users
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def limited(db, monkeypatch):
+    """The app behind an enabled admission middleware with fresh buckets, as seen from one address."""
+    monkeypatch.setattr(admission, "store", LocalBucketStore())
+    guarded = AdmissionMiddleware(app, routers=[loans.router, users.router], enabled=True)
+    transport = httpx.ASGITransport(app=guarded, client=("203.0.113.7", 4000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+async def test_signups_from_one_address_are_not_one_bucket(limited):
+    statuses = [
+        (await limited.post("/users", json={"email": f"signup{i}@example.com"})).status_code for i in range(30)
+    ]
+    assert statuses == [201] * 30
+
+async def test_write_buckets_are_per_acting_user(limited):
+    ids = [(await limited.post("/users", json={"email": f"u{i}@example.com"})).json()["id"] for i in range(2)]
+    body = {"lender_id": ids[0], "borrower_id": ids[1], "amount": "5.00", "due_date": "2030-01-01"}
+    statuses = [
+        (await limited.post("/loans", json={**body, "created_by_id": ids[1]})).status_code
+        for _ in range(int(admission.WRITE_BURST) + 1)
+    ]
+    assert statuses[-1] == 429 and set(statuses[:-1]) == {201}
+    r = await limited.post("/loans", json={**body, "created_by_id": ids[0]})  # the other party's bucket
+    assert r.status_code == 201
+
+def test_forwarded_for_only_from_trusted_proxies(monkeypatch):
+    scope = {"client": ("10.0.0.2", 1), "headers": [(b"x-forwarded-for", b"198.51.100.9, 10.0.0.3")], "path": "/users"}
+    assert admission.client_ip(scope) == "10.0.0.2"
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", [admission.ipaddress.ip_network("10.0.0.0/8")])
+    assert admission.client_ip(scope) == "198.51.100.9"
+    assert admission.client_key(scope) == "ip:198.51.100.9"
+    assert admission.client_key(scope, b'[{"user_id": 7}]') == "user:7"
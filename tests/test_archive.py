@@ -0,0 +1,38 @@
+# app/tests/test_archive.py
+import pytest
+from sqlalchemy import func, select, update
+
+from conftest import active_loan, create_users, propose_repayment
+from models import HederaOutbox, Loan, loans_archive
+from workers import archive, outbox
+
+pytestmark = pytest.mark.anyio
+
+async def _closed_loan(client, lender, borrower) -> dict:
+    loan = await active_loan(client, lender, borrower, amount="10.00")
+    conf = await propose_repayment(client, loan, "10.00")
+    r = await client.post(f"/loans/{loan['id']}/confirmations/{conf['id']}/act", json={"accept": True, "user_id": lender})
+    assert r.status_code == 200, r.text
+    return loan
+
+async def test_finished_loans_are_archived_without_a_ledger(client, session):
+    assert outbox.ledger is None  # the default deployment
+    lender, borrower = await create_users(client, 2)
+    closed = await _closed_loan(client, lender, borrower)
+    live = await active_loan(client, lender, borrower)
+
+    assert await archive.archive_loans_once(after_days=0) == 1
+    assert (await session.execute(select(Loan.id))).scalars().all() == [live["id"]]
+    assert (await session.execute(select(loans_archive.c.id))).scalars().all() == [closed["id"]]
+    assert (await client.get(f"/loans/{closed['id']}")).json()["status"] == "CLOSED"  # served from the archive
+    assert await session.scalar(select(func.count()).select_from(HederaOutbox).where(HederaOutbox.loan_id == closed["id"])) == 0
+
+async def test_loans_wait_for_the_ledger_when_one_is_configured(client, session, monkeypatch):
+    monkeypatch.setattr(outbox, "ledger", outbox.FakeLedgerClient())
+    lender, borrower = await create_users(client, 2)
+    await _closed_loan(client, lender, borrower)
+
+    assert await archive.archive_loans_once(after_days=0) == 0
+    await session.execute(update(HederaOutbox).values(sent_at=HederaOutbox.created_at))
+    await session.commit()
+    assert await archive.archive_loans_once(after_days=0) == 1
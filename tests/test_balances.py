@@ -0,0 +1,41 @@
+# app/tests/test_balances.py
+import pytest
+
+import balances
+from conftest import active_loan, create_users, propose_repayment
+from workers import overdue
+
+pytestmark = pytest.mark.anyio
+
+async def _act(client, loan, conf, user_id):
+    r = await client.post(f"/loans/{loan['id']}/confirmations/{conf['id']}/act", json={"accept": True, "user_id": user_id})
+    assert r.status_code == 200, r.text
+
+async def test_balances_match_loans_through_confirm_repay_and_sweep(client, session):
+    lender, borrower, other = await create_users(client, 3)
+    loan = await active_loan(client, lender, borrower, amount="100.00")
+    late = await active_loan(client, other, borrower, amount="30.00", due_in_days=-2)
+    await active_loan(client, lender, other, amount="15.00")
+    assert await balances.verify(session) == []
+
+    await _act(client, loan, await propose_repayment(client, loan, "40.00"), lender)
+    assert await balances.verify(session) == []
+    await _act(client, loan, await propose_repayment(client, loan, "60.00"), lender)
+    assert (await client.get(f"/loans/{loan['id']}")).json()["status"] == "CLOSED"
+    assert await balances.verify(session) == []
+
+    assert await overdue.sweep_once() == 1
+    assert (await client.get(f"/loans/{late['id']}")).json()["status"] == "OVERDUE"
+    assert await balances.verify(session) == []
+
+async def test_dashboard_totals_count_unswept_overdue_loans(client):
+    lender, borrower = await create_users(client, 2)
+    await active_loan(client, lender, borrower, amount="30.00", due_in_days=-2)
+    await active_loan(client, lender, borrower, amount="10.00")
+
+    for swept in (False, True):
+        dashboard = (await client.get(f"/loans/dashboard/{borrower}")).json()
+        assert sorted(l["status"] for l in dashboard["in_progress"]) == ["ACTIVE", "OVERDUE"], swept
+        [totals] = dashboard["totals"]
+        assert (totals["overdue_count"], totals["overdue_amount"], totals["borrowed_count"]) == (1, "30.00", 2), swept
+        await overdue.sweep_once()
@@ -0,0 +1,88 @@
+# app/tests/test_batch.py
+from collections import Counter
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import balances
+from conftest import create_users
+from models import HederaOutbox, Notification
+from workers import notifications
+
+pytestmark = pytest.mark.anyio
+
+def _item(lender, borrower, amount="10.00", due_in_days=30, **extra) -> dict:
+    return {
+        "lender_id": lender, "borrower_id": borrower, "amount": amount,
+        "due_date": str(date.today() + timedelta(days=due_in_days)), "created_by_id": borrower, **extra,
+    }
+
+async def _create(client, items) -> dict:
+    r = await client.post("/loans/batch", json=items)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+async def test_create_batch_skips_invalid_items(client):
+    lender, borrower = await create_users(client, 2)
+    result = await _create(client, [
+        _item(lender, borrower, amount="10.00"),
+        _item(lender, lender),
+        _item(lender, borrower, amount="-5"),
+        _item(lender, 999_999),
+        {"lender_id": lender},
+        _item(lender, borrower, amount="20.00"),
+    ])
+    assert [l["amount"] for l in result["created"]] == ["10.00", "20.00"]
+    assert all(l["status"] == "PENDING" and l["borrower_confirmed"] for l in result["created"])
+    assert [e["index"] for e in result["errors"]] == [1, 2, 3, 4]
+    assert result["errors"][0]["detail"] == "Lender and borrower must be different"
+    assert result["errors"][2]["detail"] == "User not found"
+
+async def test_confirm_batch_activates_only_what_the_confirmer_may_confirm(client, session):
+    lender, borrower, outsider = await create_users(client, 3)
+    soon, late, foreign = (await _create(client, [
+        _item(lender, borrower, due_in_days=30),
+        _item(lender, borrower, due_in_days=-1),
+        _item(outsider, borrower),
+    ]))["created"]
+
+    r = await client.post("/loans/confirm/batch", json=[
+        {"loan_id": soon["id"], "user_id": lender},
+        {"loan_id": foreign["id"], "user_id": lender},  # not their loan
+        {"loan_id": 999_999, "user_id": lender},
+        {"loan_id": late["id"], "user_id": lender},
+        {"loan_id": soon["id"], "user_id": lender},
+        {"user_id": lender},
+    ])
+    assert r.status_code == 200, r.text
+    result = r.json()
+    assert [(l["id"], l["status"]) for l in result["confirmed"]] == [(soon["id"], "ACTIVE"), (late["id"], "OVERDUE")]
+    assert [e["index"] for e in result["errors"]] == [1, 2, 4, 5]
+    assert result["errors"][0]["detail"] == "Loan not found or user is not lender or borrower"
+    assert result["errors"][2]["detail"] == "Duplicate loan_id in batch"
+
+    untouched = (await client.get(f"/loans/{foreign['id']}")).json()
+    assert untouched["status"] == "PENDING" and not untouched["lender_confirmed"]
+    # reminders, ledger entries and balances for the two activated loans only
+    reminders = Counter((await session.execute(select(Notification.loan_id, Notification.type))).all())
+    assert reminders == {
+        (soon["id"], "DUE_SOON"): 3, (soon["id"], "D_DAY"): 2, (soon["id"], "PAST_DUE"): notifications.PAST_DUE_REMINDERS,
+        (late["id"], "PAST_DUE"): notifications.PAST_DUE_REMINDERS,  # its earlier slots were already past
+    }
+    confirms = (await session.execute(
+        select(HederaOutbox.loan_id, HederaOutbox.payload).where(HederaOutbox.kind == "LOAN_CONFIRM")
+    )).all()
+    assert sorted(r.loan_id for r in confirms) == sorted([soon["id"], late["id"]])
+    assert all(r.payload["confirmed_by"] == lender for r in confirms)
+    assert await balances.verify(session) == []
+    [totals] = (await client.get(f"/users/{borrower}")).json()["balances"]
+    assert (totals["borrowed_count"], totals["borrowed_outstanding"], totals["overdue_count"]) == (2, "20.00", 1)
+
+async def test_single_and_batch_confirm_report_the_same_status(client):
+    lender, borrower = await create_users(client, 2)
+    one, two = (await _create(client, [_item(lender, borrower, due_in_days=-1)] * 2))["created"]
+
+    single = (await client.post(f"/loans/{one['id']}/confirm", json={"user_id": lender})).json()
+    [batched] = (await client.post("/loans/confirm/batch", json=[{"loan_id": two["id"], "user_id": lender}])).json()["confirmed"]
+    assert single["status"] == batched["status"] == "OVERDUE"
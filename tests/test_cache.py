@@ -0,0 +1,65 @@
+# app/tests/test_cache.py
+import pytest
+
+import balances
+import cache
+from cache import user_tag
+from conftest import active_loan, create_users, propose_repayment
+
+pytestmark = pytest.mark.anyio
+
+async def test_write_invalidates_cached_reads(client, cache_on):
+    lender, borrower = await create_users(client, 2)
+    loan = await active_loan(client, lender, borrower)
+    loan_url, dashboard_url = f"/loans/{loan['id']}", f"/loans/dashboard/{borrower}"
+
+    for url in (loan_url, dashboard_url):
+        await client.get(url)
+    hits = cache_on.stats.hits
+    before = (await client.get(dashboard_url)).json()
+    assert (await client.get(loan_url)).json()["repaid_amount"] == "0.00"
+    assert cache_on.stats.hits == hits + 2
+
+    conf = await propose_repayment(client, loan, "40.00")
+    r = await client.post(f"{loan_url}/confirmations/{conf['id']}/act", json={"accept": True, "user_id": lender})
+    assert r.status_code == 200, r.text
+    assert (await client.get(loan_url)).json()["repaid_amount"] == "40.00"
+    after = (await client.get(dashboard_url)).json()
+    assert after != before
+    assert after["totals"][0]["borrowed_outstanding"] == "60.00"
+
+async def test_fill_racing_an_invalidation_is_not_stored(client, cache_on, monkeypatch):
+    [user] = await create_users(client, 1)
+    url = f"/users/{user}"
+    for_user = balances.for_user
+
+    async def written_meanwhile(session, user_id):
+        rows = await for_user(session, user_id)
+        await cache.invalidate(user_tag(user_id))  # a write to the user commits while the handler runs
+        return rows
+
+    monkeypatch.setattr(balances, "for_user", written_meanwhile)
+    await client.get(url)
+    assert cache_on.stats.stale_fills == 1 and len(cache_on) == 0
+
+    monkeypatch.setattr(balances, "for_user", for_user)
+    await client.get(url)
+    await client.get(url)
+    assert len(cache_on) == 1 and cache_on.stats.hits == 1
+
+async def test_backend_drops_fills_older_than_an_invalidation():
+    backend = cache.LRUBackend(maxsize=2)
+    snapshot = await backend.snapshot()
+    await backend.invalidate("user:1")
+    await backend.set("a", 1, ["user:1"], snapshot)
+    await backend.set("b", 2, ["user:2"], snapshot)  # other tags are unaffected
+    assert await backend.get("a") is cache.MISS and await backend.get("b") == 2
+
+    # once the invalidation log is pruned, every older snapshot counts as stale
+    for i in range(3, 12):
+        await backend.invalidate(f"user:{i}")
+    await backend.set("c", 3, ["user:99"], snapshot)
+    assert await backend.get("c") is cache.MISS
+    await backend.set("c", 3, ["user:99"], await backend.snapshot())
+    assert await backend.get("c") == 3
+    assert backend.stats.stale_fills == 2
@@ -0,0 +1,61 @@
+# app/tests/test_conditional.py
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import balances
+import conditional
+from conftest import active_loan, create_users, propose_repayment
+from routers import users
+from workers import archive
+
+pytestmark = pytest.mark.anyio
+
+async def _pending_loan(client, lender, borrower) -> dict:
+    return (await client.post("/loans", json={
+        "lender_id": lender, "borrower_id": borrower, "amount": "10.00",
+        "due_date": str(date.today() + timedelta(days=30)), "created_by_id": borrower,
+    })).json()
+
+async def test_dashboard_etag_changes_when_count_and_versions_cancel_out(client):
+    lender, borrower = await create_users(client, 2)
+    url = f"/loans/dashboard/{borrower}"
+    closing = await active_loan(client, lender, borrower)
+    conf = await propose_repayment(client, closing, closing["amount"])
+    await client.post(f"/loans/{closing['id']}/confirmations/{conf['id']}/act", json={"accept": True, "user_id": lender})
+    waiting = await _pending_loan(client, lender, borrower)
+
+    first = await client.get(url)
+    etag = first.headers["etag"]
+    assert (await client.get(url, headers={"If-None-Match": etag})).status_code == 304
+
+    # -1 loan / -3 versions, then +1 loan / +3 versions: count and version sum come out unchanged
+    assert await archive.archive_loans_once(after_days=0) == 1
+    fresh = await _pending_loan(client, lender, borrower)
+    for loan in (fresh, waiting):
+        assert (await client.post(f"/loans/{loan['id']}/confirm", json={"user_id": lender})).status_code == 200
+
+    r = await client.get(url, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
+    assert len(r.json()["in_progress"]) == 2 and r.json()["closed"] == first.json()["closed"]
+
+async def test_profile_etag_changes_when_a_loan_turns_overdue_overnight(client, monkeypatch):
+    lender, borrower = await create_users(client, 2)
+    await active_loan(client, lender, borrower, due_in_days=0)
+    url = f"/users/{borrower}"
+    today = await client.get(url)
+    assert today.json()["balances"][0]["overdue_count"] == 0
+
+    class _Tomorrow(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime.utcnow() + timedelta(days=1)
+
+    for module in (balances, conditional, users):
+        monkeypatch.setattr(module, "datetime", _Tomorrow)
+    # no write and no sweep since: only the date moved
+    assert (await client.get(url, headers={"If-Modified-Since": today.headers["last-modified"]})).status_code == 200
+    r = await client.get(url, headers={"If-None-Match": today.headers["etag"]})
+    assert r.status_code == 200
+    assert r.json()["balances"][0]["overdue_count"] == 1
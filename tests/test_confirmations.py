@@ -0,0 +1,74 @@
+# app/tests/test_confirmations.py
+import pytest
+
+from conftest import active_loan, create_users, propose_repayment
+
+pytestmark = pytest.mark.anyio
+
+async def test_counterparty_accept_applies_repayment(client):
+    lender, borrower = await create_users(client, 2)
+    loan = await active_loan(client, lender, borrower)
+    conf = await propose_repayment(client, loan, "100.00")
+
+    r = await client.post(f"/loans/{loan['id']}/confirmations/{conf['id']}/act",
+                          json={"accept": True, "user_id": lender, "version": conf["version"]})
+    assert r.status_code == 200, r.text
+    assert r.json()["lender_accepted"] and r.json()["finalized_at"] is not None
+    closed = (await client.get(f"/loans/{loan['id']}")).json()
+    assert closed["status"] == "CLOSED" and closed["repaid_amount"] == "100.00"
+
+async def test_proposer_cannot_accept_for_the_counterparty(client):
+    lender, borrower, outsider = await create_users(client, 3)
+    loan = await active_loan(client, lender, borrower)
+    conf = await propose_repayment(client, loan, "100.00")
+    url = f"/loans/{loan['id']}/confirmations/{conf['id']}/act"
+
+    r = await client.post(url, json={"accept": True, "user_id": outsider})
+    assert r.status_code == 403
+    r = await client.post(url, json={"accept": True, "user_id": borrower})
+    assert r.status_code == 200
+    assert not r.json()["lender_accepted"] and r.json()["finalized_at"] is None
+    assert (await client.get(f"/loans/{loan['id']}")).json()["status"] == "ACTIVE"
+
+async def test_stale_confirmation_version_is_409(client):
+    lender, borrower = await create_users(client, 2)
+    loan = await active_loan(client, lender, borrower)
+    conf = await propose_repayment(client, loan, "40.00")
+    url = f"/loans/{loan['id']}/confirmations/{conf['id']}/act"
+
+    # the borrower re-affirms, bumping the version the lender's client loaded
+    assert (await client.post(url, json={"accept": True, "user_id": borrower, "version": conf["version"]})).status_code == 200
+    r = await client.post(url, json={"accept": True, "user_id": lender, "version": conf["version"]})
+    assert r.status_code == 409
+    assert (await client.get(f"/loans/{loan['id']}")).json()["repaid_amount"] == "0.00"
+
+async def test_proposal_for_a_closed_loan_is_closed_unapplied(client):
+    lender, borrower = await create_users(client, 2)
+    loan = await active_loan(client, lender, borrower)
+    first = await propose_repayment(client, loan, "100.00")
+    second = await propose_repayment(client, loan, "100.00")
+
+    act = "/loans/{}/confirmations/{}/act"
+    assert (await client.post(act.format(loan["id"], first["id"]), json={"accept": True, "user_id": lender})).status_code == 200
+    r = await client.post(act.format(loan["id"], second["id"]), json={"accept": True, "user_id": lender})
+    assert r.status_code == 409
+    assert "Loan is CLOSED" in r.json()["detail"] and "retry" not in r.json()["detail"]
+    # nothing left to retry: the second proposal was finalized without being applied
+    r = await client.post(act.format(loan["id"], second["id"]), json={"accept": True, "user_id": lender})
+    assert r.status_code == 409 and r.json()["detail"] == "Confirmation already finalized"
+    assert (await client.get(f"/loans/{loan['id']}")).json()["repaid_amount"] == "100.00"
+
+async def test_repayment_overtaken_by_another_is_closed_unapplied(client):
+    lender, borrower = await create_users(client, 2)
+    loan = await active_loan(client, lender, borrower)
+    first = await propose_repayment(client, loan, "60.00")
+    second = await propose_repayment(client, loan, "60.00")
+
+    act = "/loans/{}/confirmations/{}/act"
+    assert (await client.post(act.format(loan["id"], first["id"]), json={"accept": True, "user_id": lender})).status_code == 200
+    r = await client.post(act.format(loan["id"], second["id"]), json={"accept": True, "user_id": lender})
+    assert r.status_code == 409
+    assert r.json()["detail"].startswith("Repayment exceeds the outstanding amount")
+    r = await client.post(act.format(loan["id"], second["id"]), json={"accept": False, "user_id": lender})
+    assert r.status_code == 409 and r.json()["detail"] == "Confirmation already finalized"
+    assert (await client.get(f"/loans/{loan['id']}")).json()["repaid_amount"] == "60.00"
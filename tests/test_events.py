@@ -0,0 +1,34 @@
+# app/tests/test_events.py
+import pytest
+from fastapi import HTTPException
+
+import events
+from routers.events import RESET, event_stream
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = events.EventBus()
+    monkeypatch.setattr(events, "bus", bus)
+    monkeypatch.setattr(events, "MAX_CONNECTIONS_PER_USER", 1)
+    return bus
+
+async def _open(user_id: int, last_event_id=None):
+    return await event_stream(user_id, last_event_id=last_event_id, last_event_id_header=None)
+
+async def test_stream_that_never_starts_holds_no_subscription(bus):
+    for _ in range(3):  # clients gone before the body was sent
+        await _open(1)
+    assert bus.connections == 0
+
+    response = await _open(1, last_event_id="gone")
+    body = response.body_iterator
+    assert await body.__anext__() == RESET
+    assert bus.connections == 1
+    with pytest.raises(HTTPException) as exc:
+        await _open(1)
+    assert exc.value.status_code == 503
+    await body.aclose()
+    assert bus.connections == 0
+    await _open(1)
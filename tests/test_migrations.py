@@ -0,0 +1,141 @@
+# app/tests/test_migrations.py
+"""Upgrading a database created by the baseline's `create_all`, before any migration existed."""
+from datetime import date, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import select, text
+
+import balances
+import migrations
+from db import SessionLocal
+from main import app
+from models import User, UserFriend
+
+pytestmark = pytest.mark.anyio
+
+def _baseline_ddl(dialect: str) -> list[str]:
+    pg = dialect == "postgresql"
+    pk, ts = ("SERIAL", "TIMESTAMP WITHOUT TIME ZONE") if pg else ("INTEGER", "DATETIME")
+
+    def enum(name: str, length: int) -> str:
+        return name if pg else f"VARCHAR({length})"
+
+    types = [
+        "CREATE TYPE loanstatus AS ENUM ('PENDING', 'ACTIVE', 'CLOSED', 'OVERDUE', 'CANCELLED')",
+        "CREATE TYPE currency AS ENUM ('MAD', 'USD', 'EUR')",
+        "CREATE TYPE eventtype AS ENUM ('LOAN_CREATE', 'REPAYMENT', 'DUE_DATE_CHANGE')",
+    ] if pg else []
+    return types + [
+        f"""CREATE TABLE users (
+            id {pk} NOT NULL PRIMARY KEY, phone VARCHAR(32), email VARCHAR(255) NOT NULL,
+            pseudonym VARCHAR(64), photo_url VARCHAR(512), is_2fa_enabled BOOLEAN, created_at {ts} NOT NULL)""",
+        f"""CREATE TABLE loans (
+            id {pk} NOT NULL PRIMARY KEY,
+            lender_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            borrower_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            amount NUMERIC(12, 2) NOT NULL, currency {enum('currency', 3)} NOT NULL, due_date DATE NOT NULL,
+            status {enum('loanstatus', 9)} NOT NULL, lender_confirmed BOOLEAN NOT NULL,
+            borrower_confirmed BOOLEAN NOT NULL, confirmed_at {ts},
+            created_by_id INTEGER NOT NULL REFERENCES users (id) ON DELETE SET NULL,
+            created_at {ts} NOT NULL, updated_at {ts} NOT NULL)""",
+        f"""CREATE TABLE user_friends (
+            id {pk} NOT NULL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            friend_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            created_at {ts} NOT NULL)""",
+        f"""CREATE TABLE confirmations (
+            id {pk} NOT NULL PRIMARY KEY, loan_id INTEGER NOT NULL REFERENCES loans (id) ON DELETE CASCADE,
+            type {enum('eventtype', 15)} NOT NULL, payload JSON NOT NULL,
+            requested_by_id INTEGER NOT NULL REFERENCES users (id) ON DELETE SET NULL,
+            lender_accepted BOOLEAN NOT NULL, borrower_accepted BOOLEAN NOT NULL,
+            finalized_at {ts}, created_at {ts} NOT NULL)""",
+        f"""CREATE TABLE notifications (
+            id {pk} NOT NULL PRIMARY KEY, loan_id INTEGER NOT NULL REFERENCES loans (id) ON DELETE CASCADE,
+            type VARCHAR(32) NOT NULL, scheduled_at {ts} NOT NULL, sent_at {ts}, payload JSON NOT NULL)""",
+        f"""CREATE TABLE hedera_logs (
+            id {pk} NOT NULL PRIMARY KEY, loan_id INTEGER NOT NULL REFERENCES loans (id) ON DELETE CASCADE,
+            event_id INTEGER NOT NULL REFERENCES confirmations (id) ON DELETE SET NULL,
+            direction VARCHAR(3) NOT NULL, tx_id VARCHAR(128), meta JSON NOT NULL, created_at {ts} NOT NULL)""",
+        "CREATE UNIQUE INDEX ix_users_email ON users (email)",
+        "CREATE UNIQUE INDEX ix_users_phone ON users (phone)",
+        "CREATE INDEX ix_loans_lender_id ON loans (lender_id)",
+        "CREATE INDEX ix_loans_borrower_id ON loans (borrower_id)",
+        "CREATE INDEX ix_loans_status_due_date ON loans (status, due_date)",
+        "CREATE INDEX ix_user_friends_user_id ON user_friends (user_id)",
+        "CREATE INDEX ix_user_friends_friend_id ON user_friends (friend_id)",
+        "CREATE INDEX ix_confirmations_loan_id ON confirmations (loan_id)",
+        "CREATE INDEX ix_notifications_scheduled_at ON notifications (scheduled_at)",
+        "CREATE INDEX ix_notifications_loan_id ON notifications (loan_id)",
+        "CREATE INDEX ix_hedera_logs_loan_id ON hedera_logs (loan_id)",
+    ]
+
+@pytest.fixture
+async def baseline_db(fresh_db):
+    today = date.today()
+    async with fresh_db.begin() as conn:
+        for statement in _baseline_ddl(conn.dialect.name):
+            await conn.execute(text(statement))
+        await conn.execute(text(
+            "INSERT INTO users (email, phone, created_at) VALUES"
+            " ('Lender@Example.com', '+212 6-12 34 56 78', CURRENT_TIMESTAMP),"
+            " ('borrower@example.com', NULL, CURRENT_TIMESTAMP), ('friend@example.com', NULL, CURRENT_TIMESTAMP)"
+        ))
+        # both directions, a duplicate and a self-friendship, as the old endpoints could write them
+        await conn.execute(text(
+            "INSERT INTO user_friends (user_id, friend_id, created_at) VALUES"
+            " (2, 1, CURRENT_TIMESTAMP), (1, 2, CURRENT_TIMESTAMP), (3, 1, CURRENT_TIMESTAMP), (2, 2, CURRENT_TIMESTAMP)"
+        ))
+        await conn.execute(text(
+            "INSERT INTO loans (lender_id, borrower_id, amount, currency, due_date, status, lender_confirmed,"
+            " borrower_confirmed, created_by_id, created_at, updated_at) VALUES"
+            " (1, 2, 100.00, 'MAD', :soon, 'ACTIVE', TRUE, TRUE, 2, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),"
+            " (3, 1, 40.00, 'EUR', :past, 'OVERDUE', TRUE, TRUE, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),"
+            " (1, 3, 25.00, 'MAD', :past, 'CLOSED', TRUE, TRUE, 3, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+        ), {"soon": today + timedelta(days=10), "past": today - timedelta(days=5)})
+    yield fresh_db
+
+async def test_upgrade_from_baseline(baseline_db):
+    async with baseline_db.connect() as conn:
+        assert [m.version for m in migrations.pending(await migrations.applied(conn))][-1] == migrations.HEAD
+
+    applied = await migrations.upgrade(baseline_db)
+    assert [m.version for m in applied] == [m.version for m in migrations.MIGRATIONS]
+    assert await migrations.upgrade(baseline_db) == []
+    await migrations.ensure_current(baseline_db, auto_migrate=False)  # one read, nothing to do
+
+    async with SessionLocal() as session:
+        pairs = (await session.execute(select(UserFriend.user_id, UserFriend.friend_id).order_by(UserFriend.id))).all()
+        assert [tuple(p) for p in pairs] == [(1, 2), (1, 3)]
+        lender = await session.get(User, 1)
+        assert lender.email_sha256 and lender.phone_sha256 and lender.updated_at
+        assert await balances.verify(session) == []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        dashboard = (await client.get("/loans/dashboard/1")).json()
+        assert {l["id"] for l in dashboard["in_progress"]} == {1, 2}
+        assert [l["id"] for l in dashboard["closed"]] == [3]
+        assert (await client.get("/users/1/friends")).json()["friends"] == [
+            {"id": 2, "email": "borrower@example.com"}, {"id": 3, "email": "friend@example.com"},
+        ]
+        if baseline_db.dialect.name == "postgresql":  # SQLite can't add the constraint to an existing table
+            r = await client.post("/users/2/friends", json={"friend_id": 1})
+            assert r.status_code == 400, r.text
+
+async def test_fresh_database_gets_the_current_schema(fresh_db):
+    await migrations.ensure_current(fresh_db, auto_migrate=True)
+    async with fresh_db.connect() as conn:
+        assert migrations.pending(await migrations.applied(conn)) == []
+
+async def test_pending_migrations_fail_startup_without_auto_migrate(baseline_db):
+    with pytest.raises(migrations.MigrationError):
+        await migrations.ensure_current(baseline_db, auto_migrate=False)
+
+async def test_edited_migration_is_refused(fresh_db):
+    await migrations.upgrade(fresh_db)
+    async with fresh_db.begin() as conn:
+        await conn.execute(migrations.schema_migrations.update().where(
+            migrations.schema_migrations.c.version == 2
+        ).values(checksum="0" * 64))
+    with pytest.raises(migrations.MigrationError, match="changed after it was applied"):
+        await migrations.ensure_current(fresh_db)
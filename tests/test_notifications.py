@@ -0,0 +1,58 @@
+# app/tests/test_notifications.py
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, text, update
+
+from conftest import active_loan, create_users, propose_repayment
+from db import SessionLocal
+from models import Notification
+from workers import notifications
+
+pytestmark = pytest.mark.anyio
+
+class _CheckedTransport(notifications.LocalTransport):
+    """Records sends, failing on request and checking the row isn't locked meanwhile."""
+
+    def __init__(self, channel: str, fail: bool = False):
+        super().__init__(channel)
+        self.fail = fail
+
+    async def send(self, notification):
+        async with SessionLocal() as session:
+            if session.bind.dialect.name == "postgresql":
+                await session.execute(text("SET LOCAL lock_timeout = '1s'"))
+            await session.execute(
+                select(Notification.id).where(Notification.id == notification.id).with_for_update(nowait=True)
+            )
+        if self.fail:
+            raise ConnectionError("gateway down")
+        await super().send(notification)
+
+async def test_dispatch_sends_outside_the_lease_and_drops_closed_loan_reminders(client, session, monkeypatch):
+    lender, borrower = await create_users(client, 2)
+    open_loan = await active_loan(client, lender, borrower, due_in_days=5)
+    repaid = await active_loan(client, lender, borrower, amount="20.00", due_in_days=5)
+    r = await client.post(f"/loans/{repaid['id']}/confirmations/"
+                          f"{(await propose_repayment(client, repaid, '20.00'))['id']}/act",
+                          json={"accept": True, "user_id": lender})
+    assert r.status_code == 200, r.text
+    assert (await client.get(f"/loans/{repaid['id']}")).json()["status"] == "CLOSED"
+
+    past = datetime.utcnow() - timedelta(minutes=1)
+    await session.execute(update(Notification).values(scheduled_at=past))
+    await session.commit()
+    transports = {"push": _CheckedTransport("push"), "email": _CheckedTransport("email"),
+                  "sms": _CheckedTransport("sms", fail=True)}
+    monkeypatch.setattr(notifications, "transports", transports)
+
+    await notifications.dispatch_once(batch_size=5)
+
+    rows = (await session.execute(select(Notification).order_by(Notification.id))).scalars().all()
+    assert {n.loan_id for n in rows} == {open_loan["id"]}  # the closed loan's reminders were deleted
+    sent = [n for n in rows if n.sent_at is not None]
+    assert Counter(n.payload["channel"] for n in sent) == {"push": 9, "email": 1}
+    assert sorted(n.id for n in transports["push"].sent + transports["email"].sent) == sorted(n.id for n in sent)
+    [sms] = [n for n in rows if n.sent_at is None]
+    assert sms.payload["channel"] == "sms" and sms.scheduled_at > datetime.utcnow()  # retried later
@@ -0,0 +1,94 @@
+# app/tests/test_replica.py
+"""Read routing against a second database standing in for the replica (no replication between them)."""
+import importlib.util
+import os
+import time
+
+import pytest
+from sqlalchemy import MetaData, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import db as database
+from conftest import create_users
+from models import User
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def replica(db, monkeypatch, tmp_path):
+    engine = create_async_engine(os.getenv("TEST_REPLICA_DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path}/replica.db"))
+    async with engine.begin() as conn:
+        reflected = MetaData()
+        await conn.run_sync(reflected.reflect)
+        await conn.run_sync(reflected.drop_all)
+        await conn.run_sync(database.Base.metadata.create_all)
+    monkeypatch.setattr(database, "replica_engine", engine)
+    monkeypatch.setattr(database, "ReplicaSessionLocal", async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession))
+    monkeypatch.setattr(database, "replica", database.ReplicaState())
+    yield engine
+    await engine.dispose()
+
+async def _email(client, user_id: int) -> str:
+    return (await client.get(f"/users/{user_id}")).json()["email"]
+
+async def test_reads_use_the_replica_until_a_write_pins_them(client, replica):
+    a, b = await create_users(client, 2)
+    async with replica.begin() as conn:
+        await conn.execute(insert(User), [{"id": a, "email": "stale-a@example.com"}, {"id": b, "email": "stale-b@example.com"}])
+    assert database.replica.pinned([f"user:{a}"])  # creating the user pinned it
+    database.replica._pins.clear()  # as if the pin window had passed
+
+    assert await _email(client, a) == "stale-a@example.com"
+    assert (await client.post(f"/users/{a}/friends", json={"friend_id": b})).status_code in (200, 201)
+    assert await _email(client, a) == "user0@example.com"
+    assert await _email(client, b) == "user1@example.com"
+    assert database.replica.reads == {"replica": 1, "pinned": 2, "unhealthy": 0}
+
+async def test_unhealthy_replica_is_skipped(client, replica):
+    [a] = await create_users(client, 1)
+    database.replica._pins.clear()
+    database.replica.healthy = False
+    assert await _email(client, a) == "user0@example.com"
+    assert database.replica.reads["unhealthy"] == 1
+
+class _Clock:
+    """db.time with a monotonic clock the test moves by hand."""
+
+    def __init__(self):
+        self.now = time.monotonic()
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+async def test_pin_outlasts_the_lag_a_healthy_replica_may_have(client, replica, monkeypatch):
+    a, b = await create_users(client, 2)
+    async with replica.begin() as conn:
+        await conn.execute(insert(User), [{"id": a, "email": "stale-a@example.com"}, {"id": b, "email": "stale-b@example.com"}])
+    clock = _Clock()
+    monkeypatch.setattr(database, "time", clock)
+    # still healthy, and the lag may grow for a whole check interval before the monitor sees it
+    database.replica.healthy, database.replica.lag_seconds = True, database.REPLICA_MAX_LAG - 0.5
+
+    assert (await client.post(f"/users/{a}/friends", json={"friend_id": b})).status_code == 201
+    clock.now += database.REPLICA_MAX_LAG + database.REPLICA_CHECK_INTERVAL - 0.1
+    assert await _email(client, a) == "user0@example.com"
+    assert database.replica.reads == {"replica": 0, "pinned": 1, "unhealthy": 0}
+
+    clock.now += 0.2 + database.PRIMARY_PIN_SECONDS - (database.REPLICA_MAX_LAG + database.REPLICA_CHECK_INTERVAL)
+    assert await _email(client, a) == "stale-a@example.com"  # pin over: the replica serves it again
+
+def _import_db(monkeypatch, **env):
+    for name, value in {"DATABASE_REPLICA_URL": "sqlite+aiosqlite://", "DB_REPLICA_MAX_LAG": "10",
+                        "DB_REPLICA_CHECK_INTERVAL": "5", **env}.items():
+        monkeypatch.setenv(name, value)
+    spec = importlib.util.spec_from_file_location("db_settings_check", database.__file__)
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+
+def test_pin_shorter_than_lag_plus_check_interval_is_refused(monkeypatch):
+    with pytest.raises(ValueError, match="DB_PRIMARY_PIN_SECONDS"):
+        _import_db(monkeypatch, DB_PRIMARY_PIN_SECONDS="14")
+    _import_db(monkeypatch, DB_PRIMARY_PIN_SECONDS="15")
+    _import_db(monkeypatch, DB_PRIMARY_PIN_SECONDS="5", DATABASE_REPLICA_URL="")  # no replica, nothing to outlast
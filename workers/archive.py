@@ -0,0 +1,112 @@
+# app/workers/archive.py
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, literal, select
+
+from cache import invalidate, loan_tag, user_tag
+from db import SessionLocal
+from models import (
+    Confirmation, HederaLog, HederaOutbox, Loan, LoanStatus, Notification,
+    confirmations_archive, hedera_logs_archive, loans_archive, notifications_archive,
+)
+from workers import outbox
+
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))  # seconds, 0 disables the job
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_LOANS_AFTER_DAYS = int(os.getenv("ARCHIVE_LOANS_AFTER_DAYS", "90"))  # since the loan was closed / cancelled
+ARCHIVE_NOTIFICATIONS_AFTER_DAYS = int(os.getenv("ARCHIVE_NOTIFICATIONS_AFTER_DAYS", "30"))  # since it was sent
+
+FINISHED = (LoanStatus.CLOSED, LoanStatus.CANCELLED)
+
+log = logging.getLogger(__name__)
+
+def _move(model, archive, *criteria, now: datetime):
+    """INSERT INTO <archive> SELECT ... and the matching DELETE, for one hot table."""
+    table = model.__table__
+    copy = insert(archive).from_select(
+        [*table.c.keys(), "archived_at"], select(*table.c, literal(now).label("archived_at")).where(*criteria)
+    )
+    return copy, delete(model).where(*criteria)
+
+async def archive_loans_once(batch_size: int = ARCHIVE_BATCH_SIZE, after_days: int = ARCHIVE_LOANS_AFTER_DAYS) -> int:
+    """
+    Moves finished loans (with their confirmations, Hedera logs and notifications) to the
+    *_archive tables, one transaction per batch. Loans with an unsent outbox entry wait for
+    it; sent entries are dropped, their HederaLog being the record. Without a ledger client
+    nothing drains the outbox, so its entries don't hold loans back and go with them.
+    """
+    total = 0
+    while True:
+        now = datetime.utcnow()
+        async with SessionLocal() as session:
+            q = select(Loan.id, Loan.lender_id, Loan.borrower_id).where(
+                Loan.status.in_(FINISHED), Loan.updated_at < now - timedelta(days=after_days),
+            )
+            if outbox.ledger is not None:
+                pending = select(HederaOutbox.id).where(HederaOutbox.loan_id == Loan.id, HederaOutbox.sent_at.is_(None))
+                q = q.where(~pending.exists())
+            rows = (
+                await session.execute(
+                    q.order_by(Loan.id)
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+            ).all()
+            if rows:
+                ids = [r.id for r in rows]
+                # children first: hedera_logs.event_id references confirmations
+                for model, archive in (
+                    (HederaLog, hedera_logs_archive),
+                    (Notification, notifications_archive),
+                    (Confirmation, confirmations_archive),
+                ):
+                    for stmt in _move(model, archive, model.loan_id.in_(ids), now=now):
+                        await session.execute(stmt)
+                await session.execute(delete(HederaOutbox).where(HederaOutbox.loan_id.in_(ids)))
+                for stmt in _move(Loan, loans_archive, Loan.id.in_(ids), now=now):
+                    await session.execute(stmt)
+                await session.commit()
+        if rows:
+            await invalidate(*{tag for r in rows for tag in (loan_tag(r.id), user_tag(r.lender_id), user_tag(r.borrower_id))})
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
+
+async def archive_notifications_once(
+    batch_size: int = ARCHIVE_BATCH_SIZE, after_days: int = ARCHIVE_NOTIFICATIONS_AFTER_DAYS
+) -> int:
+    """Moves delivered notifications of loans that are still live; they are never read again."""
+    total = 0
+    while True:
+        now = datetime.utcnow()
+        async with SessionLocal() as session:
+            ids = (
+                await session.execute(
+                    select(Notification.id)
+                    .where(Notification.sent_at < now - timedelta(days=after_days))
+                    .order_by(Notification.id)
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+            ).scalars().all()
+            if ids:
+                for stmt in _move(Notification, notifications_archive, Notification.id.in_(ids), now=now):
+                    await session.execute(stmt)
+                await session.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+async def run(interval: float = ARCHIVE_INTERVAL) -> None:
+    while True:
+        try:
+            loans = await archive_loans_once()
+            notifications = await archive_notifications_once()
+            if loans or notifications:
+                log.info("archive: moved %d loan(s), %d notification(s)", loans, notifications)
+        except Exception:
+            log.exception("archive job failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,193 @@
+# app/workers/notifications.py
+import asyncio
+import logging
+import os
+from datetime import datetime, time, timedelta
+from typing import Protocol
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import SessionLocal
+from models import Loan, LoanStatus, Notification
+
+DISPATCH_INTERVAL = float(os.getenv("NOTIFY_DISPATCH_INTERVAL", "15"))  # seconds, 0 disables the worker
+DISPATCH_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "1000"))
+DISPATCH_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "100"))
+RETRY_DELAY = timedelta(seconds=int(os.getenv("NOTIFY_RETRY_DELAY", "300")))
+SEND_TIMEOUT = float(os.getenv("NOTIFY_SEND_TIMEOUT", "10"))  # seconds per transport.send
+# must cover a whole batch: (batch size / concurrency) sends of up to SEND_TIMEOUT each
+LEASE = timedelta(seconds=int(os.getenv("NOTIFY_LEASE", "300")))
+SEND_HOUR = time(int(os.getenv("NOTIFY_SEND_HOUR", "9")))  # UTC
+PAST_DUE_REMINDERS = int(os.getenv("NOTIFY_PAST_DUE_MAX", "6"))
+
+REMINDER_TYPES = ("DUE_SOON", "D_DAY", "PAST_DUE")
+OUTSTANDING = (LoanStatus.ACTIVE, LoanStatus.OVERDUE)
+
+log = logging.getLogger(__name__)
+
+class Transport(Protocol):
+    """Delivers one notification over a channel ('push', 'sms', 'email'); raises on failure."""
+    channel: str
+
+    async def send(self, notification: Notification) -> None: ...
+
+class LocalTransport:
+    """Records notifications instead of delivering them; for tests and local runs."""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.sent: list[Notification] = []
+
+    async def send(self, notification: Notification) -> None:
+        self.sent.append(notification)
+
+transports: dict[str, Transport] = {}
+
+def register_transport(transport: Transport) -> None:
+    transports[transport.channel] = transport
+
+if os.getenv("NOTIFY_TRANSPORT") == "local":
+    for _channel in ("push", "sms", "email"):
+        register_transport(LocalTransport(_channel))
+
+# --- scheduling ---
+def reminder_schedule(loan: Loan) -> list[tuple[str, str, datetime]]:
+    """
+    CDC cadence as (type, channel, scheduled_at):
+      - 3 days before due_date: daily push
+      - day D: SMS + email
+      - from 2 days after due_date: every 5 days, PAST_DUE_REMINDERS times
+    """
+    def at(days: int) -> datetime:
+        return datetime.combine(loan.due_date + timedelta(days=days), SEND_HOUR)
+
+    slots = [("DUE_SOON", "push", at(d)) for d in (-3, -2, -1)]
+    slots += [("D_DAY", "sms", at(0)), ("D_DAY", "email", at(0))]
+    slots += [("PAST_DUE", "push", at(2 + 5 * i)) for i in range(PAST_DUE_REMINDERS)]
+    return slots
+
+async def schedule_reminders(session: AsyncSession, loans: list[Loan], *, date_changed: bool = False) -> None:
+    """
+    (Re)writes the pending reminders of the given loans with one DELETE and one INSERT;
+    call it in the transaction that activates them or changes their due date.
+    Slots already in the past are skipped.
+    """
+    if not loans:
+        return
+    now = datetime.utcnow()
+    await session.execute(
+        delete(Notification).where(
+            Notification.loan_id.in_([loan.id for loan in loans]),
+            Notification.sent_at.is_(None),
+            Notification.type.in_(REMINDER_TYPES),
+        )
+    )
+    rows = []
+    for loan in loans:
+        payload = {"amount": str(loan.amount), "currency": loan.currency.value, "due_date": loan.due_date.isoformat()}
+        rows += [
+            {"loan_id": loan.id, "type": kind, "scheduled_at": when,
+             "payload": {**payload, "channel": channel, "user_id": loan.borrower_id}}
+            for kind, channel, when in reminder_schedule(loan) if when >= now
+        ]
+        if date_changed:
+            rows += [
+                {"loan_id": loan.id, "type": "DATE_CHANGED", "scheduled_at": now,
+                 "payload": {**payload, "channel": "push", "user_id": user_id}}
+                for user_id in (loan.lender_id, loan.borrower_id)
+            ]
+    if rows:
+        await session.execute(insert(Notification), rows)
+
+# --- dispatch ---
+async def _lease(batch_size: int, now: datetime) -> tuple[int, list[Notification]]:
+    """
+    Claims due notifications (FOR UPDATE SKIP LOCKED, so workers can run in parallel) and
+    pushes their scheduled_at past LEASE in one short transaction, so nothing stays locked
+    while the transports run. Reminders of loans no longer outstanding are deleted here.
+    Returns (rows claimed, notifications to send).
+    """
+    async with SessionLocal() as session:
+        claimed = (
+            await session.execute(
+                select(Notification.id, Notification.type, Loan.status)
+                .join(Loan, Loan.id == Notification.loan_id)
+                .where(Notification.sent_at.is_(None), Notification.scheduled_at <= now)
+                .order_by(Notification.scheduled_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True, of=Notification)
+            )
+        ).all()
+        live, stale = [], []
+        for r in claimed:
+            (stale if r.type in REMINDER_TYPES and r.status not in OUTSTANDING else live).append(r.id)
+        if stale:
+            await session.execute(
+                delete(Notification).where(Notification.id.in_(stale)).execution_options(synchronize_session=False)
+            )
+        leased = []
+        if live:
+            leased = (
+                await session.execute(
+                    update(Notification).where(Notification.id.in_(live)).values(scheduled_at=now + LEASE)
+                    .returning(Notification)
+                    .execution_options(synchronize_session=False)
+                )
+            ).scalars().all()
+        await session.commit()
+    return len(claimed), leased
+
+async def dispatch_once(batch_size: int = DISPATCH_BATCH_SIZE, concurrency: int = DISPATCH_CONCURRENCY) -> int:
+    """
+    Leases due notifications in batches, sends them with bounded concurrency (each send
+    limited to SEND_TIMEOUT) and bulk-stamps sent_at. Failed sends are pushed back by
+    RETRY_DELAY; a worker that dies mid-batch leaves them to be retried once the lease ends.
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def deliver(notification: Notification) -> None:
+        transport = transports.get(notification.payload.get("channel"))
+        if transport is None:
+            raise LookupError(f"no transport for channel {notification.payload.get('channel')!r}")
+        async with limit:
+            await asyncio.wait_for(transport.send(notification), SEND_TIMEOUT)
+
+    total = 0
+    while True:
+        claimed, leased = await _lease(batch_size, datetime.utcnow())
+        results = await asyncio.gather(*(deliver(n) for n in leased), return_exceptions=True)
+        sent, failed = [], []
+        for notification, result in zip(leased, results):
+            if isinstance(result, BaseException):
+                log.warning("notification %d not sent: %r", notification.id, result)
+                failed.append(notification.id)
+            else:
+                sent.append(notification.id)
+        done = datetime.utcnow()
+        if sent or failed:
+            async with SessionLocal() as session:
+                if sent:
+                    await session.execute(
+                        update(Notification).where(Notification.id.in_(sent)).values(sent_at=done)
+                        .execution_options(synchronize_session=False)
+                    )
+                if failed:
+                    await session.execute(
+                        update(Notification).where(Notification.id.in_(failed)).values(scheduled_at=done + RETRY_DELAY)
+                        .execution_options(synchronize_session=False)
+                    )
+                await session.commit()
+        total += claimed
+        if claimed < batch_size:
+            return total
+
+async def run(interval: float = DISPATCH_INTERVAL) -> None:
+    while True:
+        try:
+            sent = await dispatch_once()
+            if sent:
+                log.info("notifications: %d processed", sent)
+        except Exception:
+            log.exception("notification dispatch failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,167 @@
+# app/workers/outbox.py
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional, Protocol
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import SessionLocal
+from models import HederaLog, HederaOutbox
+
+DRAIN_INTERVAL = float(os.getenv("OUTBOX_DRAIN_INTERVAL", "2"))  # seconds
+DRAIN_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+DRAIN_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "10"))
+LEASE = timedelta(seconds=int(os.getenv("OUTBOX_LEASE", "60")))  # must exceed the ledger client's timeout
+BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))
+
+# A2B / B2A between the two admin accounts, per event kind
+DIRECTIONS = {"LOAN_CREATE": "A2B", "LOAN_CONFIRM": "B2A", "REPAYMENT": "B2A", "DUE_DATE_CHANGE": "A2B"}
+
+log = logging.getLogger(__name__)
+
+@dataclass
+class LedgerReceipt:
+    tx_id: str
+    meta: dict = field(default_factory=dict)
+
+class LedgerClient(Protocol):
+    """Submits one non-repudiation transfer; raises on failure."""
+
+    async def submit(self, entry: HederaOutbox) -> LedgerReceipt: ...
+
+class FakeLedgerClient:
+    """Accepts everything with a made-up transaction id; for tests and local runs."""
+
+    def __init__(self):
+        self.submitted: list[HederaOutbox] = []
+
+    async def submit(self, entry: HederaOutbox) -> LedgerReceipt:
+        self.submitted.append(entry)
+        return LedgerReceipt(tx_id=f"0.0.0@{time.time():.9f}-{uuid.uuid4().hex[:8]}", meta={"fake": True})
+
+ledger: Optional[LedgerClient] = FakeLedgerClient() if os.getenv("HEDERA_LEDGER") == "fake" else None
+
+def set_ledger_client(client: Optional[LedgerClient]) -> None:
+    global ledger
+    ledger = client
+
+@dataclass
+class OutboxStats:
+    submitted: int = 0
+    failed: int = 0
+    batches: int = 0
+    last_batch_size: int = 0
+    last_batch_seconds: float = 0.0
+
+stats = OutboxStats()
+
+def enqueue(session: AsyncSession, loan_id: int, kind: str, *, event_id: Optional[int] = None, **payload) -> None:
+    """Adds an outbox row to the caller's transaction; it is committed (or not) with the loan change."""
+    session.add(HederaOutbox(
+        loan_id=loan_id, event_id=event_id, kind=kind, direction=DIRECTIONS[kind], payload=payload,
+    ))
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE ** attempts)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+async def drain_once(
+    client: LedgerClient, batch_size: int = DRAIN_BATCH_SIZE, concurrency: int = DRAIN_CONCURRENCY
+) -> int:
+    """
+    Leases a batch of pending entries (bumping next_attempt_at in one short transaction, so
+    no row lock is held while waiting on the ledger), submits them concurrently, then records
+    HederaLog rows for the successes and reschedules failures with exponential backoff.
+    """
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    async with SessionLocal() as session:
+        due = (
+            select(HederaOutbox.id)
+            .where(HederaOutbox.sent_at.is_(None), HederaOutbox.next_attempt_at <= now)
+            .order_by(HederaOutbox.next_attempt_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        leased = (
+            await session.execute(
+                update(HederaOutbox)
+                .where(HederaOutbox.id.in_(due.scalar_subquery()))
+                .values(next_attempt_at=now + LEASE)
+                .returning(HederaOutbox)
+                .execution_options(synchronize_session=False)
+            )
+        ).scalars().all()
+        await session.commit()
+    if not leased:
+        return 0
+
+    limit = asyncio.Semaphore(concurrency)
+
+    async def submit(entry: HederaOutbox) -> LedgerReceipt:
+        async with limit:
+            return await client.submit(entry)
+
+    results = await asyncio.gather(*(submit(e) for e in leased), return_exceptions=True)
+
+    done = datetime.utcnow()
+    logs, sent_ids = [], []
+    async with SessionLocal() as session:
+        for entry, result in zip(leased, results):
+            if isinstance(result, BaseException):
+                log.warning("outbox entry %d failed (attempt %d): %r", entry.id, entry.attempts + 1, result)
+                await session.execute(
+                    update(HederaOutbox).where(HederaOutbox.id == entry.id).values(
+                        attempts=HederaOutbox.attempts + 1,
+                        next_attempt_at=done + _backoff(entry.attempts + 1),
+                        last_error=repr(result)[:512],
+                    )
+                )
+                continue
+            sent_ids.append(entry.id)
+            logs.append({
+                "loan_id": entry.loan_id, "event_id": entry.event_id, "direction": entry.direction,
+                "tx_id": result.tx_id, "meta": {"kind": entry.kind, **entry.payload, **result.meta},
+            })
+        if logs:
+            await session.execute(insert(HederaLog), logs)
+            await session.execute(
+                update(HederaOutbox).where(HederaOutbox.id.in_(sent_ids)).values(sent_at=done)
+                .execution_options(synchronize_session=False)
+            )
+        await session.commit()
+
+    stats.submitted += len(sent_ids)
+    stats.failed += len(leased) - len(sent_ids)
+    stats.batches += 1
+    stats.last_batch_size = len(leased)
+    stats.last_batch_seconds = time.perf_counter() - started
+    return len(leased)
+
+async def pending_lag(session: AsyncSession) -> dict:
+    """Backlog size and age of the oldest unsent entry, in seconds."""
+    count, oldest = (
+        await session.execute(
+            select(func.count(), func.min(HederaOutbox.created_at)).where(HederaOutbox.sent_at.is_(None))
+        )
+    ).one()
+    lag = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+    return {"pending": count, "oldest_pending_seconds": lag}
+
+async def run(client: LedgerClient, interval: float = DRAIN_INTERVAL) -> None:
+    while True:
+        try:
+            # keep draining while full batches come back, then sleep
+            while await drain_once(client) >= DRAIN_BATCH_SIZE:
+                pass
+        except Exception:
+            log.exception("outbox drain failed")
+        await asyncio.sleep(interval)
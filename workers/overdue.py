@@ -0,0 +1,68 @@
+# app/workers/overdue.py
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+import balances
+import events
+from cache import invalidate, loan_tag, user_tag
+from db import SessionLocal
+from models import Loan, LoanStatus
+
+SWEEP_INTERVAL = float(os.getenv("OVERDUE_SWEEP_INTERVAL", "300"))  # seconds, 0 disables the job
+SWEEP_BATCH_SIZE = int(os.getenv("OVERDUE_SWEEP_BATCH_SIZE", "500"))
+
+log = logging.getLogger(__name__)
+
+async def sweep_once(batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """
+    Moves every ACTIVE loan past its due date to OVERDUE, one short transaction per batch.
+    Candidates are picked through ix_loans_status_due_date; SKIP LOCKED lets several
+    workers sweep at once without waiting on each other.
+    """
+    total = 0
+    while True:
+        now = datetime.utcnow()
+        due = (
+            select(Loan.id)
+            .where(Loan.status == LoanStatus.ACTIVE, Loan.due_date < now.date())
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with SessionLocal() as session:
+            result = await session.execute(
+                update(Loan)
+                .where(Loan.id.in_(due.scalar_subquery()), Loan.status == LoanStatus.ACTIVE)
+                .values(status=LoanStatus.OVERDUE, updated_at=now, version=Loan.version + 1)
+                .returning(Loan.id, Loan.lender_id, Loan.borrower_id, Loan.currency, Loan.status,
+                           Loan.amount, Loan.repaid_amount, Loan.version)
+                .execution_options(synchronize_session=False)
+            )
+            swept = result.all()
+            await balances.apply(session, [
+                (balances.LoanState.of(row, status=LoanStatus.ACTIVE), balances.LoanState.of(row)) for row in swept
+            ])
+            await events.publish(session, *(
+                events.event_for("loan.updated", (row.lender_id, row.borrower_id),
+                                 loan_id=row.id, status=row.status.value, version=row.version)
+                for row in swept
+            ))
+            await session.commit()
+        await invalidate(*{tag for row in swept
+                           for tag in (loan_tag(row.id), user_tag(row.lender_id), user_tag(row.borrower_id))})
+        total += len(swept)
+        if len(swept) < batch_size:
+            return total
+
+async def run(interval: float = SWEEP_INTERVAL) -> None:
+    while True:
+        try:
+            swept = await sweep_once()
+            if swept:
+                log.info("overdue sweep: %d loan(s) marked OVERDUE", swept)
+        except Exception:
+            log.exception("overdue sweep failed")
+        await asyncio.sleep(interval)